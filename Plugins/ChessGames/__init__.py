@@ -4,7 +4,11 @@
 """
 
 import asyncio
+import concurrent.futures
 import logging
+import threading
+from functools import partial
+from typing import Optional
 
 from Core.logging.file_logger import log_error
 from Core.message.builder import MessageBuilder
@@ -19,6 +23,9 @@ from .systems.render import RenderSystem
 class Plugin(BasePlugin):
     """棋类游戏插件主类"""
 
+    # 单条命令的最长执行时间（秒）
+    ASYNC_TIMEOUT = 30
+
     def __init__(self):
         super().__init__()
 
@@ -69,35 +76,79 @@ class Plugin(BasePlugin):
             'bot_stop': [self.on_bot_stop_hook]
         }
 
-        # 命令处理器映射
-        self.command_handlers = {
-            '#': self.handle_tictactoe,
-            'f': self.handle_gomoku,
-            '游戏菜单': self.handle_chess_menu,
-            '游戏状态': self.handle_game_status,
-            '游戏信息': self.handle_game_info,
-            '游戏排行榜': self.handle_game_ranking,
-            '认输': self.handle_surrender
+        # 命令分发表 {命令: (日志名称, 是否需要参数, 协程工厂(user_id, group_id, args))}
+        handler = self.command_handler
+        self._dispatch_table = {
+            '#': ('井字棋', True, lambda user_id, group_id, args: handler.handle_tictactoe(
+                user_id, group_id, args, self._current_message_data)),
+            'f': ('五子棋', True, lambda user_id, group_id, args: handler.handle_gomoku(
+                user_id, group_id, args, self._current_message_data)),
+            '游戏菜单': ('chess菜单', True, handler.handle_chess_menu),
+            '游戏状态': ('游戏状态', False, lambda user_id, group_id, args: handler._show_game_status_text(
+                user_id, group_id)),
+            '游戏信息': ('游戏信息', False, lambda user_id, group_id, args: handler._show_user_stats_html(
+                user_id, group_id)),
+            '游戏排行榜': ('游戏排行榜', False, lambda user_id, group_id, args: handler._show_ranking_html(
+                group_id, [])),
+            '认输': ('认输', False, lambda user_id, group_id, args: handler.handle_surrender(user_id, group_id))
         }
 
+        # 命令处理器映射
+        self.command_handlers = {name: partial(self._dispatch, name) for name in self._dispatch_table}
+
+        # 命令前缀（含斜杠及大写形式），用于快速过滤非游戏消息
+        prefixes = list(self.command_handlers)
+        prefixes += [command.upper() for command in self.command_handlers if command.upper() != command]
+        self._trigger_prefixes = tuple(prefixes) + tuple(f'/{prefix}' for prefix in prefixes)
+
         # 当前消息数据（用于命令处理器）
         self._current_message_data = None
         self._current_bot_id = None
 
+        # 后台事件循环（独立守护线程中运行，所有命令协程都提交到这里执行）
+        self._bg_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bg_thread: Optional[threading.Thread] = None
+        self._bg_lock = threading.Lock()
+        self._start_bg_loop()
+
+    def _start_bg_loop(self) -> asyncio.AbstractEventLoop:
+        """启动后台事件循环线程（已在运行时直接返回）"""
+        with self._bg_lock:
+            if self._bg_thread is None or not self._bg_thread.is_alive():
+                self._bg_loop = asyncio.new_event_loop()
+                self._bg_thread = threading.Thread(target=self._bg_loop.run_forever,
+                                                   name="ChessGamesLoop", daemon=True)
+                self._bg_thread.start()
+            return self._bg_loop
+
+    def _stop_bg_loop(self):
+        """停止后台事件循环线程"""
+        with self._bg_lock:
+            if self._bg_loop is not None and self._bg_thread is not None and self._bg_thread.is_alive():
+                self._bg_loop.call_soon_threadsafe(self._bg_loop.stop)
+            self._bg_thread = None
+
     def run_async(self, coro):
         """运行异步函数的辅助方法"""
+        loop = self._bg_loop
+        if self._bg_thread is None or not self._bg_thread.is_alive():
+            loop = self._start_bg_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，创建任务
-                task = asyncio.create_task(coro)
-                return task
-            else:
-                # 如果事件循环未运行，直接运行
-                return loop.run_until_complete(coro)
-        except RuntimeError:
-            # 如果没有事件循环，创建新的
-            return asyncio.run(coro)
+            return future.result(timeout=self.ASYNC_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # 超时后取消协程，避免已报告失败的命令在后台继续修改棋局
+            future.cancel()
+            raise
+
+    def run_on_loop(self, func, *args):
+        """在后台事件循环线程中执行同步函数
+
+        游戏状态只在事件循环线程中修改，Hook线程中的清理操作也需要通过这里执行
+        """
+        async def call():
+            return func(*args)
+        return self.run_async(call())
 
     def get_user_group_from_message(self, message_data):
         """从消息数据中提取用户ID和群组ID"""
@@ -111,107 +162,15 @@ class Plugin(BasePlugin):
 
     # ==================== 命令处理方法 ====================
 
-    def handle_tictactoe(self, args):
-        """处理井字棋命令"""
-        try:
-            user_id, group_id = self.get_user_group_from_message(self._current_message_data)
-            if not user_id or not group_id:
-                return MessageBuilder.text("❌ 无法获取用户或群组信息")
-
-            # 设置当前机器人ID
-            self.command_handler.set_current_bot_id(self._current_bot_id)
-
-            return self.run_async(
-                self.command_handler.handle_tictactoe(user_id, group_id, args, self._current_message_data))
-
-        except Exception as e:
-            self.logger.error(f"井字棋命令处理失败: {e}")
-            return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
-
-    def handle_gomoku(self, args):
-        """处理五子棋命令"""
-        try:
-            user_id, group_id = self.get_user_group_from_message(self._current_message_data)
-            if not user_id or not group_id:
-                return MessageBuilder.text("❌ 无法获取用户或群组信息")
-
-            # 设置当前机器人ID
-            self.command_handler.set_current_bot_id(self._current_bot_id)
-
-            return self.run_async(
-                self.command_handler.handle_gomoku(user_id, group_id, args, self._current_message_data))
-
-        except Exception as e:
-            self.logger.error(f"五子棋命令处理失败: {e}")
-            return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
-
-    def handle_chess_menu(self, args):
-        """处理chess菜单命令"""
-        try:
-            user_id, group_id = self.get_user_group_from_message(self._current_message_data)
-            if not user_id or not group_id:
-                return MessageBuilder.text("❌ 无法获取用户或群组信息")
-
-            # 设置当前机器人ID
-            self.command_handler.set_current_bot_id(self._current_bot_id)
-
-            return self.run_async(self.command_handler.handle_chess_menu(user_id, group_id, args))
-
-        except Exception as e:
-            self.logger.error(f"chess菜单命令处理失败: {e}")
-            return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
-
-    def handle_surrender(self, args):
-        """处理认输命令"""
-        try:
-            user_id, group_id = self.get_user_group_from_message(self._current_message_data)
-            if not user_id or not group_id:
-                return MessageBuilder.text("❌ 无法获取用户或群组信息")
-
-            # 设置当前机器人ID
-            self.command_handler.set_current_bot_id(self._current_bot_id)
-
-            return self.run_async(self.command_handler.handle_surrender(user_id, group_id))
+    def _dispatch(self, name, rest):
+        """统一的命令处理入口：提取用户群组信息后交给命令处理器
 
-        except Exception as e:
-            self.logger.error(f"认输命令处理失败: {e}")
-            return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
-
-    def handle_game_status(self, args):
-        """处理游戏状态命令"""
+        rest为命令后的原始参数字符串，仅在命令需要参数时才拆分
+        """
+        label, needs_args, coro_factory = self._dispatch_table[name]
         try:
-            user_id, group_id = self.get_user_group_from_message(self._current_message_data)
-            if not user_id or not group_id:
-                return MessageBuilder.text("❌ 无法获取用户或群组信息")
-
-            # 设置当前机器人ID
-            self.command_handler.set_current_bot_id(self._current_bot_id)
-
-            return self.run_async(self.command_handler._show_game_status_text(user_id, group_id))
-
-        except Exception as e:
-            self.logger.error(f"游戏状态命令处理失败: {e}")
-            return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
-
-    def handle_game_info(self, args):
-        """处理游戏信息命令"""
-        try:
-            user_id, group_id = self.get_user_group_from_message(self._current_message_data)
-            if not user_id or not group_id:
-                return MessageBuilder.text("❌ 无法获取用户或群组信息")
-
-            # 设置当前机器人ID
-            self.command_handler.set_current_bot_id(self._current_bot_id)
-
-            return self.run_async(self.command_handler._show_user_stats_html(user_id, group_id))
-
-        except Exception as e:
-            self.logger.error(f"游戏信息命令处理失败: {e}")
-            return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
+            args = rest.split() if needs_args and rest else []
 
-    def handle_game_ranking(self, args):
-        """处理游戏排行榜命令"""
-        try:
             user_id, group_id = self.get_user_group_from_message(self._current_message_data)
             if not user_id or not group_id:
                 return MessageBuilder.text("❌ 无法获取用户或群组信息")
@@ -219,10 +178,10 @@ class Plugin(BasePlugin):
             # 设置当前机器人ID
             self.command_handler.set_current_bot_id(self._current_bot_id)
 
-            return self.run_async(self.command_handler._show_ranking_html(group_id, []))
+            return self.run_async(coro_factory(user_id, group_id, args))
 
         except Exception as e:
-            self.logger.error(f"游戏排行榜命令处理失败: {e}")
+            self.logger.error(f"{label}命令处理失败: {e}")
             return MessageBuilder.text("❌ 命令处理失败，请稍后重试")
 
     # ==================== Hook事件处理器 ====================
@@ -241,46 +200,44 @@ class Plugin(BasePlugin):
             return result
 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
-            log_error(bot_id or 0, f"棋类游戏插件处理消息异常: {e}", "CHESS_GAMES_HOOK_ERROR")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("棋类游戏插件处理消息异常", exc_info=True)
+            log_error(bot_id or 0, "棋类游戏插件处理消息异常", "CHESS_GAMES_HOOK_ERROR", error=str(e))
             return {'handled': False}
 
     def _handle_command(self, content, bot_id):
         """处理命令的内部方法"""
 
+        # 快速过滤：不以任何命令开头的消息直接跳过
+        if not content.startswith(self._trigger_prefixes):
+            return {'handled': False}
+
         # 移除开头的斜杠（如果有）
         if content.startswith('/'):
             content = content[1:]
 
-        # 分割命令和参数
-        parts = content.split()
-        if not parts:
-            return {'handled': False}
-
-        command = parts[0].lower()
-        args = parts[1:] if len(parts) > 1 else []
-
-        # 检查是否是支持的命令
-        if command in self.command_handlers:
+        # 分割命令和参数（参数保持原始字符串，由处理器按需拆分）
+        command, _, rest = content.partition(' ')
+        handler = self.command_handlers.get(command)
+        if handler is None:
+            # 兼容大写命令及其他空白分隔符
+            parts = content.split(None, 1)
+            if not parts:
+                return {'handled': False}
+            handler = self.command_handlers.get(parts[0].lower())
+            rest = parts[1] if len(parts) > 1 else ''
+
+        if handler:
             try:
-                response = self.command_handlers[command](args)
-
-                # 检查是否是多消息响应
-                if isinstance(response, list):
-                    return {
-                        'response': response,
-                        'handled': True
-                    }
-                else:
-                    return {
-                        'response': response,
-                        'handled': True
-                    }
+                # 响应可能是单条消息或多消息列表
+                return {
+                    'response': handler(rest),
+                    'handled': True
+                }
             except Exception as e:
-                import traceback
-                traceback.print_exc()
-                log_error(bot_id or 0, f"棋类游戏插件命令处理异常: {e}", "CHESS_GAMES_COMMAND_ERROR")
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("棋类游戏插件命令处理异常", exc_info=True)
+                log_error(bot_id or 0, "棋类游戏插件命令处理异常", "CHESS_GAMES_COMMAND_ERROR", error=str(e))
                 return {
                     'response': MessageBuilder.text("❌ 命令处理失败，请稍后重试"),
                     'handled': True
@@ -298,7 +255,10 @@ class Plugin(BasePlugin):
     def on_bot_stop_hook(self, bot_id):
         """机器人停止Hook"""
         # 清理该机器人的活跃游戏
-        self.game_manager.cleanup_bot_games(bot_id)
+        try:
+            self.run_on_loop(self.game_manager.cleanup_bot_games, bot_id)
+        except Exception as e:
+            self.logger.error(f"清理机器人 {bot_id} 的游戏失败: {e}")
         self.logger.info(f"棋类游戏插件已为机器人 {bot_id} 清理资源")
         return {'message': f'棋类游戏插件已为机器人 {bot_id} 清理资源'}
 
@@ -313,5 +273,15 @@ class Plugin(BasePlugin):
         """插件禁用时调用"""
         super().on_disable()
         # 清理所有活跃游戏
-        self.game_manager.cleanup_all_games()
+        try:
+            self.run_on_loop(self.game_manager.cleanup_all_games)
+        except Exception as e:
+            self.logger.error(f"清理游戏失败: {e}")
+        # 写入尚未保存的游戏结果
+        try:
+            self.run_async(self.command_handler.close())
+        except Exception as e:
+            self.logger.error(f"保存游戏结果失败: {e}")
+        self._stop_bg_loop()
+        self.render_system.shutdown()
         self.logger.info("棋类游戏插件已禁用")
@@ -3,12 +3,68 @@
 """
 
 import os
-from datetime import datetime
-from typing import Optional, List
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Optional, List, Set, Tuple, Dict, Any
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Index, CheckConstraint
+from sqlalchemy import create_engine, event, text, Column, Integer, String, DateTime, Boolean, Text, Index, CheckConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
+
+from .cache import TTLCache
+
+# 查询缓存未命中标记
+_MISSING = object()
+
+# 时间字段存储格式（与SQLAlchemy的SQLite DateTime格式一致）
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _utc_now() -> str:
+    """当前UTC时间（一次写入操作的所有行共用同一个时间戳）"""
+    return datetime.now(timezone.utc).strftime(_DATETIME_FORMAT)
+
+
+# 热路径预编译SQL
+_SQL_INSERT_GAME = (
+    "INSERT INTO game_records (game_type, player1_id, player2_id, group_id, winner_id, "
+    "start_time, end_time, moves_count, game_data, is_ai_game) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_SQL_UPSERT_STATS = (
+    "INSERT INTO user_stats (user_id, group_id, game_type, total_games, wins, losses, draws, "
+    "best_streak, current_streak, last_game_time) "
+    "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, group_id, game_type) DO UPDATE SET "
+    "total_games = total_games + 1, "
+    "wins = wins + excluded.wins, "
+    "losses = losses + excluded.losses, "
+    "draws = draws + excluded.draws, "
+    "current_streak = CASE WHEN excluded.wins THEN current_streak + 1 "
+    "WHEN excluded.losses THEN 0 ELSE current_streak END, "
+    "best_streak = CASE WHEN excluded.wins THEN MAX(best_streak, current_streak + 1) ELSE best_streak END, "
+    "last_game_time = excluded.last_game_time"
+)
+# 胜率（百分比，未取整）：与 wins / total_games * 100 的浮点运算顺序一致，无对局时为0
+_SQL_WIN_RATE = "COALESCE(CAST(wins AS REAL) / NULLIF(total_games, 0) * 100, 0) AS win_rate"
+_SQL_SELECT_STATS = (
+    "SELECT id, user_id, group_id, game_type, total_games, wins, losses, draws, "
+    "best_streak, current_streak, last_game_time, " + _SQL_WIN_RATE + " "
+    "FROM user_stats WHERE user_id = ? AND group_id = ? AND game_type = ?"
+)
+_SQL_SELECT_RANKING = (
+    "SELECT user_id, total_games, wins, losses, draws, " + _SQL_WIN_RATE + ", best_streak "
+    "FROM user_stats WHERE group_id = ? AND game_type = ? AND total_games > 0 "
+    "ORDER BY wins DESC, total_games DESC LIMIT ?"
+)
+_SQL_SELECT_STATS_GROUPS = "SELECT DISTINCT group_id, game_type FROM user_stats"
+
+_SQL_SELECT_RECENT_GAMES = (
+    "SELECT player1_id, winner_id, moves_count, start_time "
+    "FROM game_records WHERE group_id = ? "
+    "ORDER BY start_time DESC LIMIT ?"
+)
 
 Base = declarative_base()
 
@@ -81,7 +137,9 @@ class UserStats(Base):
         # 性能索引
         Index('idx_stats_user_group', 'user_id', 'group_id'),
         Index('idx_stats_game_type', 'game_type'),
-        Index('idx_stats_wins_desc', 'wins'),
+        # 排行榜覆盖索引：按群组+游戏类型定位后，倒序扫描即满足 wins DESC, total_games DESC
+        Index('idx_stats_ranking', 'group_id', 'game_type', 'wins', 'total_games',
+              'user_id', 'losses', 'draws', 'best_streak'),
     )
 
 
@@ -95,57 +153,99 @@ class DatabaseManager:
         # 确保数据目录存在
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
-        # 创建数据库引擎
-        self.engine = create_engine(f'sqlite:///{self.db_path}', echo=False)
-
-        # 创建会话工厂
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # 创建数据库引擎（单文件SQLite，复用同一连接）
+        self.engine = create_engine(
+            f'sqlite:///{self.db_path}',
+            echo=False,
+            connect_args={'check_same_thread': False},
+            poolclass=StaticPool
+        )
+        event.listen(self.engine, 'connect', self._set_sqlite_pragmas)
+
+        # 热路径使用的原生sqlite3连接（每线程一个），同时登记在列表中以便统一关闭
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        # 查询缓存（战绩更新时失效）
+        self._rank_cache = TTLCache(maxsize=512, ttl=30)
+        self._stats_cache = TTLCache(maxsize=4096, ttl=30)
+
+        # 有战绩的(group_id, game_type)集合，未玩过的群直接返回空结果；None表示尚未加载
+        self._stats_groups: Optional[Set[Tuple[str, str]]] = None
+
+    @staticmethod
+    def _set_sqlite_pragmas(dbapi_connection, connection_record=None):
+        """连接建立时设置SQLite参数（WAL模式，减少fsync）"""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA mmap_size=268435456")
+            cursor.execute("PRAGMA cache_size=-20000")
+        finally:
+            cursor.close()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的sqlite3连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # 连接只在创建它的线程中使用，关闭时由close()在其他线程统一关闭
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._set_sqlite_pragmas(conn)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """关闭所有线程的sqlite3连接和数据库引擎（插件禁用时调用）"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            # 丢弃各线程保存的旧连接，之后的查询会重新建立连接
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.engine.dispose()
 
     def init_database(self):
         """初始化数据库"""
         try:
             # 创建所有表
             Base.metadata.create_all(bind=self.engine)
+
+            # 已有数据库补建新增索引，并移除被排行榜索引取代的旧索引
+            with self.engine.begin() as conn:
+                for index in UserStats.__table__.indexes:
+                    index.create(conn, checkfirst=True)
+                conn.execute(text("DROP INDEX IF EXISTS idx_stats_wins_desc"))
+
+            self._stats_groups = {
+                (row['group_id'], row['game_type'])
+                for row in self._get_connection().execute(_SQL_SELECT_STATS_GROUPS)
+            }
             return True
         except Exception as e:
             raise Exception(f"数据库初始化失败: {e}")
 
-    def get_session(self) -> Session:
-        """获取数据库会话"""
-        return self.SessionLocal()
-
-    def close_session(self, session: Session):
-        """关闭数据库会话"""
-        try:
-            session.close()
-        except Exception:
-            pass
-
     def save_game_record(self, game_type: str, player1_id: str, player2_id: str,
                          group_id: str, winner_id: Optional[str], moves_count: int,
-                         game_data: str, is_ai_game: bool = False) -> bool:
+                         game_data: Optional[str], is_ai_game: bool = False) -> bool:
         """保存游戏记录"""
-        session = self.get_session()
+        now = _utc_now()
         try:
-            record = GameRecord(
-                game_type=game_type,
-                player1_id=player1_id,
-                player2_id=player2_id,
-                group_id=group_id,
-                winner_id=winner_id,
-                end_time=datetime.utcnow(),
-                moves_count=moves_count,
-                game_data=game_data,
-                is_ai_game=is_ai_game
-            )
-            session.add(record)
-            session.commit()
+            conn = self._get_connection()
+            with conn:
+                conn.execute(_SQL_INSERT_GAME, (game_type, player1_id, player2_id, group_id, winner_id,
+                                                now, now, moves_count, game_data, int(is_ai_game)))
             return True
         except Exception as e:
-            session.rollback()
             raise Exception(f"保存游戏记录失败: {e}")
-        finally:
-            self.close_session(session)
 
     def update_user_stats(self, user_id: str, group_id: str, game_type: str,
                           result: str) -> bool:
@@ -157,89 +257,117 @@ class DatabaseManager:
             game_type: 游戏类型
             result: 游戏结果 ('win', 'loss', 'draw')
         """
-        session = self.get_session()
+        now = _utc_now()
         try:
-            # 查找或创建用户统计记录
-            stats = session.query(UserStats).filter(
-                UserStats.user_id == user_id,
-                UserStats.group_id == group_id,
-                UserStats.game_type == game_type
-            ).first()
-
-            if not stats:
-                stats = UserStats(
-                    user_id=user_id,
-                    group_id=group_id,
-                    game_type=game_type
-                )
-                session.add(stats)
-
-            # 确保字段不为None
-            stats.total_games = (stats.total_games or 0) + 1
-            stats.wins = stats.wins or 0
-            stats.losses = stats.losses or 0
-            stats.draws = stats.draws or 0
-            stats.best_streak = stats.best_streak or 0
-            stats.current_streak = stats.current_streak or 0
-            stats.last_game_time = datetime.utcnow()
-
-            if result == 'win':
-                stats.wins += 1
-                stats.current_streak += 1
-                stats.best_streak = max(stats.best_streak, stats.current_streak)
-            elif result == 'loss':
-                stats.losses += 1
-                stats.current_streak = 0
-            elif result == 'draw':
-                stats.draws += 1
-                # 平局不影响连胜
-
-            session.commit()
-            return True
+            conn = self._get_connection()
+            with conn:
+                conn.execute(_SQL_UPSERT_STATS, self._stats_params(user_id, group_id, game_type, result, now))
         except Exception as e:
-            session.rollback()
             raise Exception(f"更新用户统计失败: {e}")
-        finally:
-            self.close_session(session)
 
-    def get_user_stats(self, user_id: str, group_id: str, game_type: str) -> Optional[UserStats]:
-        """获取用户统计数据"""
-        session = self.get_session()
+        self._mark_stats_group(group_id, game_type)
+        self._invalidate_stats_cache(user_id, group_id, game_type)
+        return True
+
+    def save_game_result(self, game_type: str, player1_id: str, player2_id: str,
+                         group_id: str, winner_id: Optional[str], moves_count: int,
+                         game_data: Optional[str], is_ai_game: bool = False) -> bool:
+        """在同一事务中保存游戏记录并更新玩家统计（AI不计入统计）"""
+        return self.save_game_results([{
+            'game_type': game_type, 'player1_id': player1_id, 'player2_id': player2_id,
+            'group_id': group_id, 'winner_id': winner_id, 'moves_count': moves_count,
+            'game_data': game_data, 'is_ai_game': is_ai_game,
+        }])
+
+    def save_game_results(self, results: List[Dict[str, Any]]) -> bool:
+        """在同一事务中批量保存游戏记录并更新玩家统计
+
+        Args:
+            results: 游戏结果列表，每项的键与save_game_result的参数相同
+        """
+        now = _utc_now()
+        game_params = []
+        stats_params = []
+        touched = set()
+        for r in results:
+            game_type, group_id, winner_id = r['game_type'], r['group_id'], r['winner_id']
+            is_ai_game = r.get('is_ai_game', False)
+            game_params.append((game_type, r['player1_id'], r['player2_id'], group_id, winner_id,
+                                now, now, r['moves_count'], r['game_data'], int(is_ai_game)))
+            players = [r['player1_id']] if is_ai_game else [r['player1_id'], r['player2_id']]
+            for player_id in players:
+                if winner_id is None:
+                    result = 'draw'
+                elif winner_id == player_id:
+                    result = 'win'
+                else:
+                    result = 'loss'
+                stats_params.append(self._stats_params(player_id, group_id, game_type, result, now))
+                touched.add((player_id, group_id, game_type))
+
         try:
-            stats = session.query(UserStats).filter(
-                UserStats.user_id == user_id,
-                UserStats.group_id == group_id,
-                UserStats.game_type == game_type
-            ).first()
+            conn = self._get_connection()
+            with conn:
+                conn.executemany(_SQL_INSERT_GAME, game_params)
+                conn.executemany(_SQL_UPSERT_STATS, stats_params)
+        except Exception as e:
+            raise Exception(f"保存游戏结果失败: {e}")
+
+        for player_id, group_id, game_type in touched:
+            self._mark_stats_group(group_id, game_type)
+            self._invalidate_stats_cache(player_id, group_id, game_type)
+        return True
+
+    @staticmethod
+    def _stats_params(user_id: str, group_id: str, game_type: str, result: str, now: str) -> tuple:
+        """构建统计UPSERT参数（首条记录的连胜数等于胜场数）"""
+        win = 1 if result == 'win' else 0
+        loss = 1 if result == 'loss' else 0
+        draw = 1 if result == 'draw' else 0
+        return user_id, group_id, game_type, win, loss, draw, win, win, now
+
+    def _mark_stats_group(self, group_id: str, game_type: str):
+        """记录该群已有战绩"""
+        if self._stats_groups is not None:
+            self._stats_groups.add((group_id, game_type))
+
+    def _has_stats_group(self, group_id: str, game_type: str) -> bool:
+        """该群是否可能有战绩（未加载时按有处理）"""
+        return self._stats_groups is None or (group_id, game_type) in self._stats_groups
+
+    def _invalidate_stats_cache(self, user_id: str, group_id: str, game_type: str):
+        """战绩变化后清除相关缓存"""
+        self._stats_cache.pop((user_id, group_id, game_type))
+        self._rank_cache.pop_where(lambda key: key[0] == group_id and key[1] == game_type)
+
+    def get_user_stats(self, user_id: str, group_id: str, game_type: str) -> Optional[sqlite3.Row]:
+        """获取用户统计数据"""
+        if not self._has_stats_group(group_id, game_type):
+            return None
+
+        key = (user_id, group_id, game_type)
+        stats = self._stats_cache.get(key, _MISSING)
+        if stats is not _MISSING:
             return stats
-        finally:
-            self.close_session(session)
 
-    def get_group_ranking(self, group_id: str, game_type: str, limit: int = 10) -> List[UserStats]:
+        stats = self._get_connection().execute(_SQL_SELECT_STATS, key).fetchone()
+        self._stats_cache.set(key, stats)
+        return stats
+
+    def get_group_ranking(self, group_id: str, game_type: str, limit: int = 10) -> List[sqlite3.Row]:
         """获取群组排行榜"""
-        session = self.get_session()
-        try:
-            rankings = session.query(UserStats).filter(
-                UserStats.group_id == group_id,
-                UserStats.game_type == game_type,
-                UserStats.total_games > 0
-            ).order_by(
-                UserStats.wins.desc(),
-                UserStats.total_games.desc()
-            ).limit(limit).all()
+        if not self._has_stats_group(group_id, game_type):
+            return []
+
+        key = (group_id, game_type, limit)
+        rankings = self._rank_cache.get(key)
+        if rankings is not None:
             return rankings
-        finally:
-            self.close_session(session)
 
-    def get_recent_games(self, group_id: str, limit: int = 10) -> List[GameRecord]:
+        rankings = self._get_connection().execute(_SQL_SELECT_RANKING, key).fetchall()
+        self._rank_cache.set(key, rankings)
+        return rankings
+
+    def get_recent_games(self, group_id: str, limit: int = 10) -> List[sqlite3.Row]:
         """获取最近的游戏记录"""
-        session = self.get_session()
-        try:
-            games = session.query(GameRecord).filter(
-                GameRecord.group_id == group_id
-            ).order_by(
-                GameRecord.start_time.desc()
-            ).limit(limit).all()
-            return games
-        finally:
-            self.close_session(session)
+        return self._get_connection().execute(_SQL_SELECT_RECENT_GAMES, (group_id, limit)).fetchall()
@@ -2,14 +2,20 @@
 游戏状态管理器
 """
 
+import heapq
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Set, Tuple
 
 
 class GameSession:
     """游戏会话类"""
 
+    # 固定属性，不为每个会话分配__dict__
+    __slots__ = ('game_id', 'game_type', 'player1_id', 'player2_id', 'group_id', 'bot_id', '_turn',
+                 'start_time', 'last_move_mono', 'moves_count', 'game_state', 'is_finished', 'winner_id',
+                 'is_ai_game', 'ai_difficulty')
+
     def __init__(self, game_id: str, game_type: str, player1_id: str,
                  player2_id: str, group_id: str, bot_id: int):
         self.game_id = game_id
@@ -18,22 +24,40 @@ class GameSession:
         self.player2_id = player2_id
         self.group_id = group_id
         self.bot_id = bot_id
-        self.current_player = player1_id  # 当前轮到的玩家
+        self._turn = 0  # 当前轮到的玩家序号，0=玩家1，1=玩家2
         self.start_time = datetime.utcnow()
-        self.last_move_time = datetime.utcnow()
+        # 超时判断使用单调时钟，不受系统时间调整影响
+        self.last_move_mono = time.monotonic()
         self.moves_count = 0
         self.game_state = None  # 具体的游戏状态对象
         self.is_finished = False
         self.winner_id = None
         self.is_ai_game = player2_id == 'AI'
+        self.ai_difficulty = 'medium'  # AI对战的难度级别（开局时设置）
+
+    @property
+    def current_player(self) -> str:
+        """当前轮到的玩家"""
+        return self.player2_id if self._turn else self.player1_id
+
+    @current_player.setter
+    def current_player(self, player_id: str):
+        self._turn = 0 if player_id == self.player1_id else 1
 
     def switch_player(self):
         """切换当前玩家"""
-        if self.current_player == self.player1_id:
-            self.current_player = self.player2_id
-        else:
-            self.current_player = self.player1_id
-        self.last_move_time = datetime.utcnow()
+        self._turn ^= 1
+        self.last_move_mono = time.monotonic()
+
+    def record_move(self, moves_count: int):
+        """记录落子：更新步数和最后落子时间（超时清理以最后落子时间为准）"""
+        self.moves_count = moves_count
+        self.last_move_mono = time.monotonic()
+
+    @property
+    def last_move_time(self) -> datetime:
+        """最后一步的时间（由单调时钟换算，仅用于展示和序列化）"""
+        return datetime.utcnow() - timedelta(seconds=time.monotonic() - self.last_move_mono)
 
     def is_player_turn(self, player_id: str) -> bool:
         """检查是否轮到指定玩家"""
@@ -45,7 +69,7 @@ class GameSession:
 
     def is_timeout(self, timeout_minutes: int = 10) -> bool:
         """检查游戏是否超时"""
-        return datetime.utcnow() - self.last_move_time > timedelta(minutes=timeout_minutes)
+        return time.monotonic() - self.last_move_mono > timeout_minutes * 60
 
     def get_opponent(self, player_id: str) -> Optional[str]:
         """获取对手ID"""
@@ -75,28 +99,40 @@ class GameSession:
             'moves_count': self.moves_count,
             'is_finished': self.is_finished,
             'winner_id': self.winner_id,
-            'is_ai_game': self.is_ai_game
+            'is_ai_game': self.is_ai_game,
+            'ai_difficulty': self.ai_difficulty
         }
 
 
 class GameManager:
-    """游戏状态管理器"""
+    """游戏状态管理器（非线程安全，只在插件的后台事件循环线程中使用）"""
 
     def __init__(self):
         # 活跃游戏会话 {game_id: GameSession}
         self.active_games: Dict[str, GameSession] = {}
 
-        # 用户游戏映射 {user_id: game_id}
-        self.user_games: Dict[str, str] = {}
+        # 用户游戏映射 {user_id: GameSession}，直接保存会话，查找用户游戏只需一次字典查询
+        self.user_games: Dict[str, GameSession] = {}
+
+        # 群组游戏映射 {group_id: {game_id1, game_id2, ...}}
+        self.group_games: Dict[str, Set[str]] = {}
+
+        # 机器人游戏映射 {bot_id: {game_id1, game_id2, ...}}
+        self.bot_games: Dict[int, Set[str]] = {}
+
+        # 等待匹配的玩家 {group_id: {game_type: {user_id: 加入时的单调时间}}}，字典保持加入顺序
+        self.waiting_players: Dict[str, Dict[str, Dict[str, float]]] = {}
 
-        # 群组游戏映射 {group_id: [game_id1, game_id2, ...]}
-        self.group_games: Dict[str, List[str]] = {}
+        # 活跃游戏计数（创建/移除时增量更新）
+        self._type_counts: Dict[str, int] = {'tictactoe': 0, 'gomoku': 0}
+        self._ai_count = 0
 
-        # 机器人游戏映射 {bot_id: [game_id1, game_id2, ...]}
-        self.bot_games: Dict[int, List[str]] = {}
+        # 超时检查小顶堆 [(最后落子的单调时间, game_id)]，已移除或已更新的条目在弹出时跳过
+        self._timeout_heap: List[Tuple[float, str]] = []
 
-        # 等待匹配的玩家 {group_id: {game_type: [(user_id, timestamp), ...]}}
-        self.waiting_players: Dict[str, Dict[str, List[tuple]]] = {}
+        # 等待超时小顶堆 [(超时的单调时间, 加入时的单调时间, group_id, game_type, user_id)]，
+        # 已匹配、已取消或重新加入的条目在弹出时跳过
+        self._waiting_heap: List[Tuple[float, float, str, str, str]] = []
 
     def generate_game_id(self, game_type: str, player1_id: str, group_id: str) -> str:
         """生成游戏ID"""
@@ -120,19 +156,20 @@ class GameManager:
 
         # 添加到各种映射中
         self.active_games[game_id] = session
-        self.user_games[player1_id] = game_id
+        self.user_games[player1_id] = session
         if player2_id != 'AI':
-            self.user_games[player2_id] = game_id
+            self.user_games[player2_id] = session
 
-        # 添加到群组游戏列表
-        if group_id not in self.group_games:
-            self.group_games[group_id] = []
-        self.group_games[group_id].append(game_id)
+        # 添加到群组和机器人游戏集合
+        self.group_games.setdefault(group_id, set()).add(game_id)
+        self.bot_games.setdefault(bot_id, set()).add(game_id)
 
-        # 添加到机器人游戏列表
-        if bot_id not in self.bot_games:
-            self.bot_games[bot_id] = []
-        self.bot_games[bot_id].append(game_id)
+        # 更新计数
+        self._type_counts[game_type] = self._type_counts.get(game_type, 0) + 1
+        self._ai_count += session.is_ai_game
+
+        # 加入超时检查堆
+        heapq.heappush(self._timeout_heap, (session.last_move_mono, game_id))
 
         return session
 
@@ -142,125 +179,156 @@ class GameManager:
 
     def get_user_game(self, user_id: str, group_id: str = None) -> Optional[GameSession]:
         """获取用户当前的游戏"""
-        # 如果指定了群组，查找该用户在该群组中的游戏
-        if group_id:
-            for game_id, game in self.active_games.items():
-                if (game.group_id == group_id and
-                        game.is_player_in_game(user_id) and
-                        not game.is_finished):
-                    return game
-            return None
+        # 每个用户同时只能在一局游戏中，直接通过用户映射查找
+        game = self.user_games.get(user_id)
 
-        # 如果没有指定群组，使用原来的逻辑（向后兼容）
-        game_id = self.user_games.get(user_id)
-        if game_id:
-            return self.active_games.get(game_id)
-        return None
+        # 如果指定了群组，只返回该群组中未结束的游戏
+        if group_id and game is not None and (game.group_id != group_id or game.is_finished):
+            return None
+        return game
 
     def get_group_games(self, group_id: str) -> List[GameSession]:
         """获取群组中的所有活跃游戏"""
-        game_ids = self.group_games.get(group_id, [])
+        game_ids = self.group_games.get(group_id, ())
         return [self.active_games[game_id] for game_id in game_ids if game_id in self.active_games]
 
     def add_waiting_player(self, user_id: str, group_id: str, game_type: str, timeout_minutes: int = 1) -> Optional[
         str]:
         """添加等待匹配的玩家，如果找到匹配则返回对手ID"""
-        current_time = time.time()
-
-        if group_id not in self.waiting_players:
-            self.waiting_players[group_id] = {}
+        return self.try_match_or_enqueue(user_id, group_id, game_type, timeout_minutes)[1]
 
-        if game_type not in self.waiting_players[group_id]:
-            self.waiting_players[group_id][game_type] = []
+    def try_match_or_enqueue(self, user_id: str, group_id: str, game_type: str,
+                             timeout_minutes: int = 1) -> Tuple[str, Optional[str]]:
+        """匹配等待中的对手，没有对手时加入等待队列
 
-        waiting_list = self.waiting_players[group_id][game_type]
-
-        # 清理超时的等待玩家
+        Returns:
+            ('matched', 对手ID)、('enqueued', None)，或用户已在队列中时返回('already', None)
+        """
+        # 清理超时的等待玩家（可能删除空队列，所以先清理再取队列）
         self._cleanup_expired_waiting_players(group_id, game_type, timeout_minutes)
 
+        waiting = self.waiting_players.setdefault(group_id, {}).setdefault(game_type, {})
+
         # 检查是否已经在等待列表中
-        for waiting_user, _ in waiting_list:
-            if waiting_user == user_id:
-                return None
+        if user_id in waiting:
+            return 'already', None
 
         # 如果有其他玩家在等待，进行匹配
-        if waiting_list:
-            opponent_id, _ = waiting_list.pop(0)  # 取出第一个等待的玩家
-            # 清理空列表
-            if not waiting_list:
-                del self.waiting_players[group_id][game_type]
-                if not self.waiting_players[group_id]:
-                    del self.waiting_players[group_id]
-            return opponent_id
+        if waiting:
+            opponent_id = next(iter(waiting))  # 取出第一个等待的玩家
+            del waiting[opponent_id]
+            # 清理空队列
+            if not waiting:
+                self._remove_waiting_queue(group_id, game_type)
+            return 'matched', opponent_id
         else:
             # 没有等待的玩家，加入等待列表
-            waiting_list.append((user_id, current_time))
-            return None
+            joined = time.monotonic()
+            waiting[user_id] = joined
+            heapq.heappush(self._waiting_heap, (joined + timeout_minutes * 60, joined, group_id, game_type, user_id))
+            return 'enqueued', None
+
+    def _remove_waiting_queue(self, group_id: str, game_type: str):
+        """删除空的等待队列"""
+        del self.waiting_players[group_id][game_type]
+        if not self.waiting_players[group_id]:
+            del self.waiting_players[group_id]
 
     def _cleanup_expired_waiting_players(self, group_id: str, game_type: str, timeout_minutes: int):
         """清理超时的等待玩家"""
-        if (group_id not in self.waiting_players or
-                game_type not in self.waiting_players[group_id]):
+        waiting = self.waiting_players.get(group_id, {}).get(game_type)
+        if waiting is None:
             return
 
-        current_time = time.time()
-        timeout_seconds = timeout_minutes * 60
-        waiting_list = self.waiting_players[group_id][game_type]
+        deadline = time.monotonic() - timeout_minutes * 60
+
+        # 队列按加入时间排序，只需删除队首超时的玩家
+        expired = []
+        for waiting_user, joined in waiting.items():
+            if joined > deadline:
+                break
+            expired.append(waiting_user)
+        for waiting_user in expired:
+            del waiting[waiting_user]
+
+        if not waiting:
+            # 所有玩家都超时，删除队列
+            self._remove_waiting_queue(group_id, game_type)
+
+    def next_waiting_expiry(self) -> Optional[float]:
+        """最早的等待超时时间（单调时间），没有等待的玩家时返回None"""
+        return self._waiting_heap[0][0] if self._waiting_heap else None
+
+    def cleanup_expired_waiting_players(self) -> int:
+        """清理所有群组中超时的等待玩家，返回移除的人数"""
+        now = time.monotonic()
+        heap = self._waiting_heap
+        count = 0
 
-        # 过滤掉超时的玩家
-        valid_players = [(user_id, timestamp) for user_id, timestamp in waiting_list
-                         if current_time - timestamp < timeout_seconds]
+        # 只检查堆顶已超时的条目
+        while heap and heap[0][0] <= now:
+            _, joined, group_id, game_type, user_id = heapq.heappop(heap)
+            waiting = self.waiting_players.get(group_id, {}).get(game_type)
+            if waiting is None or waiting.get(user_id) != joined:
+                continue
+            del waiting[user_id]
+            if not waiting:
+                self._remove_waiting_queue(group_id, game_type)
+            count += 1
 
-        if len(valid_players) != len(waiting_list):
-            # 有玩家超时，更新列表
-            if valid_players:
-                self.waiting_players[group_id][game_type] = valid_players
-            else:
-                # 所有玩家都超时，删除列表
-                del self.waiting_players[group_id][game_type]
-                if not self.waiting_players[group_id]:
-                    del self.waiting_players[group_id]
+        return count
 
     def remove_waiting_player(self, user_id: str, group_id: str, game_type: str) -> bool:
         """移除等待匹配的玩家"""
-        if (group_id in self.waiting_players and
-                game_type in self.waiting_players[group_id]):
-
-            waiting_list = self.waiting_players[group_id][game_type]
-            for i, (waiting_user, _) in enumerate(waiting_list):
-                if waiting_user == user_id:
-                    waiting_list.pop(i)
-
-                    # 清理空列表
-                    if not waiting_list:
-                        del self.waiting_players[group_id][game_type]
-                        if not self.waiting_players[group_id]:
-                            del self.waiting_players[group_id]
-                    return True
-        return False
+        waiting = self.waiting_players.get(group_id, {}).get(game_type)
+        if waiting is None or waiting.pop(user_id, None) is None:
+            return False
+
+        # 清理空队列
+        if not waiting:
+            self._remove_waiting_queue(group_id, game_type)
+        return True
 
     def get_waiting_players(self, group_id: str, game_type: str) -> List[str]:
-        """获取等待匹配的玩家列表"""
-        if (group_id in self.waiting_players and
-                game_type in self.waiting_players[group_id]):
-            # 先清理超时玩家
-            self._cleanup_expired_waiting_players(group_id, game_type, 1)
-            # 返回用户ID列表
-            if (group_id in self.waiting_players and
-                    game_type in self.waiting_players[group_id]):
-                return [user_id for user_id, _ in self.waiting_players[group_id][game_type]]
-        return []
+        """获取等待匹配的玩家（按加入顺序）"""
+        # 先清理超时玩家
+        self._cleanup_expired_waiting_players(group_id, game_type, 1)
+        return list(self.waiting_players.get(group_id, {}).get(game_type, ()))
+
+    def is_waiting(self, user_id: str, group_id: str, game_type: str) -> bool:
+        """检查用户是否在等待匹配（先清理超时玩家）"""
+        self._cleanup_expired_waiting_players(group_id, game_type, 1)
+        return user_id in self.waiting_players.get(group_id, {}).get(game_type, ())
 
     def get_waiting_time(self, user_id: str, group_id: str, game_type: str) -> Optional[int]:
         """获取用户等待时间（秒）"""
-        if (group_id in self.waiting_players and
-                game_type in self.waiting_players[group_id]):
+        joined = self.waiting_players.get(group_id, {}).get(game_type, {}).get(user_id)
+        if joined is None:
+            return None
+        return int(time.monotonic() - joined)
 
-            current_time = time.time()
-            for waiting_user, timestamp in self.waiting_players[group_id][game_type]:
-                if waiting_user == user_id:
-                    return int(current_time - timestamp)
-        return None
+    def get_user_status(self, user_id: str, group_id: str, cleanup_type: Optional[str] = None) -> Dict[str, Any]:
+        """一次获取用户在群组中的状态
+
+        Args:
+            cleanup_type: 先清理该游戏类型中超时的等待玩家（与get_waiting_players一致）
+
+        Returns:
+            {'current_game': 进行中的游戏或None, 'waiting_times': {游戏类型: 已等待秒数}}，只包含正在等待的类型
+        """
+        if cleanup_type is not None:
+            self._cleanup_expired_waiting_players(group_id, cleanup_type, 1)
+
+        waiting_times = {}
+        group_waiting = self.waiting_players.get(group_id)
+        if group_waiting:
+            now = time.monotonic()
+            for game_type, waiting in group_waiting.items():
+                joined = waiting.get(user_id)
+                if joined is not None:
+                    waiting_times[game_type] = int(now - joined)
+
+        return {'current_game': self.get_user_game(user_id, group_id), 'waiting_times': waiting_times}
 
     def remove_game(self, game_id: str) -> bool:
         """移除游戏"""
@@ -275,32 +343,50 @@ class GameManager:
         if session.player2_id != 'AI' and session.player2_id in self.user_games:
             del self.user_games[session.player2_id]
 
-        # 从群组游戏列表中移除
-        if session.group_id in self.group_games:
-            if game_id in self.group_games[session.group_id]:
-                self.group_games[session.group_id].remove(game_id)
-            if not self.group_games[session.group_id]:
+        # 从群组游戏集合中移除
+        group_game_ids = self.group_games.get(session.group_id)
+        if group_game_ids is not None:
+            group_game_ids.discard(game_id)
+            if not group_game_ids:
                 del self.group_games[session.group_id]
 
-        # 从机器人游戏列表中移除
-        if session.bot_id in self.bot_games:
-            if game_id in self.bot_games[session.bot_id]:
-                self.bot_games[session.bot_id].remove(game_id)
-            if not self.bot_games[session.bot_id]:
+        # 从机器人游戏集合中移除
+        bot_game_ids = self.bot_games.get(session.bot_id)
+        if bot_game_ids is not None:
+            bot_game_ids.discard(game_id)
+            if not bot_game_ids:
                 del self.bot_games[session.bot_id]
 
+        # 更新计数
+        self._type_counts[session.game_type] -= 1
+        self._ai_count -= session.is_ai_game
+
         # 从活跃游戏中移除
         del self.active_games[game_id]
         return True
 
+    def next_game_timeout(self, timeout_minutes: int = 10) -> Optional[float]:
+        """超时检查堆中最早的超时时间（单调时间），堆为空时返回None"""
+        return self._timeout_heap[0][0] + timeout_minutes * 60 if self._timeout_heap else None
+
     def cleanup_timeout_games(self, timeout_minutes: int = 10) -> List[str]:
         """清理超时的游戏"""
         timeout_games = []
-
-        for game_id, session in list(self.active_games.items()):
-            if session.is_timeout(timeout_minutes):
-                timeout_games.append(game_id)
-                self.remove_game(game_id)
+        deadline = time.monotonic() - timeout_minutes * 60
+        heap = self._timeout_heap
+
+        # 只检查堆顶可能超时的游戏
+        while heap and heap[0][0] < deadline:
+            last_move_mono, game_id = heapq.heappop(heap)
+            session = self.active_games.get(game_id)
+            if session is None:
+                continue
+            if session.last_move_mono != last_move_mono:
+                # 之后有过落子，按新的时间重新入堆
+                heapq.heappush(heap, (session.last_move_mono, game_id))
+                continue
+            timeout_games.append(game_id)
+            self.remove_game(game_id)
 
         return timeout_games
 
@@ -309,7 +395,7 @@ class GameManager:
         if bot_id not in self.bot_games:
             return 0
 
-        game_ids = self.bot_games[bot_id].copy()
+        game_ids = list(self.bot_games[bot_id])
         count = 0
 
         for game_id in game_ids:
@@ -325,6 +411,9 @@ class GameManager:
         self.user_games.clear()
         self.group_games.clear()
         self.bot_games.clear()
+        self._timeout_heap.clear()
+        self._type_counts = {'tictactoe': 0, 'gomoku': 0}
+        self._ai_count = 0
         return count
 
     def get_stats(self) -> Dict[str, Any]:
@@ -335,8 +424,8 @@ class GameManager:
             'active_groups_count': len(self.group_games),
             'active_bots_count': len(self.bot_games),
             'game_types': {
-                'tictactoe': len([g for g in self.active_games.values() if g.game_type == 'tictactoe']),
-                'gomoku': len([g for g in self.active_games.values() if g.game_type == 'gomoku'])
+                'tictactoe': self._type_counts['tictactoe'],
+                'gomoku': self._type_counts['gomoku']
             },
-            'ai_games_count': len([g for g in self.active_games.values() if g.is_ai_game])
+            'ai_games_count': self._ai_count
         }
@@ -16,7 +16,9 @@ class GameResult(Enum):
 
 
 class MoveResult:
-    """移动结果类"""
+    """移动结果类（可能是共享的常量实例，创建后不要修改）"""
+
+    __slots__ = ('result', 'winner', 'message', 'board_changed')
 
     def __init__(self, result: GameResult, winner: Optional[str] = None,
                  message: str = "", board_changed: bool = True):
@@ -29,10 +31,13 @@ class MoveResult:
 class BaseGame(ABC):
     """游戏基类"""
 
+    # 子类同样声明__slots__，实例不再分配__dict__
+    __slots__ = ('player1_id', 'player2_id', '_turn', 'moves_count', 'is_finished', 'winner')
+
     def __init__(self, player1_id: str, player2_id: str):
         self.player1_id = player1_id
         self.player2_id = player2_id
-        self.current_player = player1_id
+        self._turn = 0  # 当前轮到的玩家序号，0=玩家1，1=玩家2
         self.moves_count = 0
         self.is_finished = False
         self.winner = None
@@ -52,6 +57,10 @@ class BaseGame(ABC):
         """获取棋盘状态"""
         pass
 
+    def get_board_view(self) -> Any:
+        """获取棋盘状态的只读视图（调用方不得修改），默认返回副本"""
+        return self.get_board_state()
+
     @abstractmethod
     def get_available_moves(self) -> List[Any]:
         """获取可用的移动"""
@@ -67,12 +76,18 @@ class BaseGame(ABC):
         """克隆游戏状态"""
         pass
 
+    @property
+    def current_player(self) -> str:
+        """当前轮到的玩家"""
+        return self.player2_id if self._turn else self.player1_id
+
+    @current_player.setter
+    def current_player(self, player_id: str):
+        self._turn = 0 if player_id == self.player1_id else 1
+
     def switch_player(self):
         """切换当前玩家"""
-        if self.current_player == self.player1_id:
-            self.current_player = self.player2_id
-        else:
-            self.current_player = self.player1_id
+        self._turn ^= 1
 
     def is_player_turn(self, player_id: str) -> bool:
         """检查是否轮到指定玩家"""
@@ -100,7 +115,7 @@ class BaseGame(ABC):
             'moves_count': self.moves_count,
             'is_finished': self.is_finished,
             'winner': self.winner,
-            'board_state': self.get_board_state()
+            'board_state': self.get_board_view()
         }
 
     @classmethod
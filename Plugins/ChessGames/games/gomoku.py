@@ -2,23 +2,62 @@
 五子棋游戏实现
 """
 
+import copy
+import re
+from functools import lru_cache
 from typing import List, Optional, Dict, Any, Tuple
 
 from .base_game import BaseGame, GameResult, MoveResult
 
+# 四个方向：水平、垂直、对角线1、对角线2
+_DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+# 落子位置格式：列字母+行数字，如 H8
+_MOVE_RE = re.compile(r'\s*([A-Za-z])\s*(\d+)\s*')
+_ORD_A = ord('a')
+
+# 文本棋盘符号（按格子值索引），最后一步使用实心符号标记
+_BOARD_SYMBOLS = ('·', '●', '○')
+_LAST_MOVE_SYMBOLS = ('·', '⚫', '⚪')
+
+# 玩家1、玩家2的棋子颜色
+_COLORS = ('黑', '白')
+
+# 无效移动的结果（共享实例，不要修改）
+_INVALID_FINISHED = MoveResult(GameResult.INVALID, message="\n❌ 游戏已结束", board_changed=False)
+_INVALID_TURN = MoveResult(GameResult.INVALID, message="\n❌ 不是您的回合", board_changed=False)
+_INVALID_FORMAT = MoveResult(GameResult.INVALID, message="\n❌ 无效的位置格式，请使用如 H8 的格式", board_changed=False)
+_INVALID_OCCUPIED = MoveResult(GameResult.INVALID, message="\n❌ 该位置已被占用或超出棋盘范围", board_changed=False)
+
+# 连续9位（落子点前后各4格）
+_WINDOW_MASK = (1 << 9) - 1
+
+
+@lru_cache(maxsize=None)
+def _column_header(board_size: int) -> str:
+    """文本棋盘的列标题，如 "   A B C ... " """
+    return "   " + "".join(f"{chr(65 + j)} " for j in range(board_size))
+
 
 class Gomoku(BaseGame):
     """五子棋游戏类"""
 
+    __slots__ = ('board_size', '_max_moves', 'board', 'player_symbols', 'player_numbers', 'player_colors',
+                 'last_move', 'winning_line', '_line_bits')
+
     def __init__(self, player1_id: str, player2_id: str, board_size: int = 15):
         super().__init__(player1_id, player2_id)
         self.board_size = board_size
+        self._max_moves = board_size * board_size
         # 棋盘，0=空，1=玩家1(黑)，2=玩家2(白)
         self.board = [[0 for _ in range(board_size)] for _ in range(board_size)]
         self.player_symbols = {player1_id: '●', player2_id: '○'}
         self.player_numbers = {player1_id: 1, player2_id: 2}
         self.player_colors = {player1_id: '黑', player2_id: '白'}
         self.last_move = None  # 记录最后一步
+        self.winning_line = None  # 获胜的五子连线位置
+        # 每个玩家按行、列、两条对角线存储的位棋盘，用于快速判断五连
+        self._line_bits = self._build_line_bits()
 
     def make_move(self, player_id: str, move: str) -> MoveResult:
         """执行移动
@@ -28,36 +67,40 @@ class Gomoku(BaseGame):
             move: 移动位置，格式如 "H8" (列行)
         """
         if self.is_finished:
-            return MoveResult(GameResult.INVALID, message="\n❌ 游戏已结束")
+            return _INVALID_FINISHED
 
         if not self.is_player_turn(player_id):
-            return MoveResult(GameResult.INVALID, message="\n❌ 不是您的回合")
+            return _INVALID_TURN
 
         # 解析移动位置
         coords = self._parse_move(move)
         if not coords:
-            return MoveResult(GameResult.INVALID, message="\n❌ 无效的位置格式，请使用如 H8 的格式")
+            return _INVALID_FORMAT
 
         row, col = coords
         if not self.is_valid_move((row, col)):
-            return MoveResult(GameResult.INVALID, message="\n❌ 该位置已被占用或超出棋盘范围")
+            return _INVALID_OCCUPIED
 
-        # 执行移动
-        self.board[row][col] = self.player_numbers[player_id]
+        # 执行移动（按玩家序号取棋子编号和颜色，不再查以用户ID为键的字典）
+        index = self._turn
+        player_num = index + 1
+        self.board[row][col] = player_num
+        self._set_line_bits(player_num, row, col)
         self.moves_count += 1
         self.last_move = (row, col)
 
         # 检查游戏结果
         if self._check_winner(row, col):
+            self.winning_line = self._get_winning_line(row, col)
             self.finish_game(player_id)
-            color = self.player_colors[player_id]
+            color = _COLORS[index]
             return MoveResult(GameResult.WIN, player_id, f"\n🎉 {color}棋获胜！")
         elif self._is_board_full():
             self.finish_game()
             return MoveResult(GameResult.DRAW, message="\n🤝 平局！棋盘已满")
         else:
             self.switch_player()
-            next_color = self.player_colors[self.current_player]
+            next_color = _COLORS[index ^ 1]
             return MoveResult(GameResult.CONTINUE, message=f"\n轮到{next_color}棋下棋")
 
     def is_valid_move(self, move: Tuple[int, int]) -> bool:
@@ -68,139 +111,143 @@ class Gomoku(BaseGame):
         return self.board[row][col] == 0
 
     def get_board_state(self) -> List[List[int]]:
-        """获取棋盘状态"""
+        """获取棋盘状态（副本）"""
         return [row[:] for row in self.board]
 
+    def get_board_view(self) -> List[List[int]]:
+        """获取棋盘本身（只读，调用方不得修改）"""
+        return self.board
+
+    def get_bitboards(self) -> Tuple[int, int]:
+        """获取(玩家1位棋盘, 玩家2位棋盘)，第row*board_size+col位对应一个格子"""
+        size = self.board_size
+        result = []
+        for player in (1, 2):
+            bb = 0
+            for row, bits in enumerate(self._line_bits[player][0]):
+                bb |= bits << (row * size)
+            result.append(bb)
+        return result[0], result[1]
+
     def get_available_moves(self) -> List[Tuple[int, int]]:
         """获取可用的移动位置"""
-        moves = []
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                if self.board[i][j] == 0:
-                    moves.append((i, j))
-        return moves
+        return [(i, j) for i, row in enumerate(self.board) for j, cell in enumerate(row) if cell == 0]
 
     def get_board_display(self) -> str:
         """获取棋盘的文本显示"""
-        symbols = {0: '·', 1: '●', 2: '○'}
+        last_move = self.last_move
 
-        display = "```\n五子棋棋盘：\n\n"
+        # 列标题（顶部和底部共用）
+        header = _column_header(self.board_size)
 
-        # 列标题
-        display += "   "
-        for j in range(self.board_size):
-            display += f"{chr(65 + j)} "
-        display += "\n"
+        parts = ["```\n五子棋棋盘：\n\n", header, "\n"]
 
         # 棋盘内容
-        for i in range(self.board_size):
-            display += f"{i + 1:2d} "
-            for j in range(self.board_size):
-                symbol = symbols[self.board[i][j]]
-                # 标记最后一步
-                if self.last_move and self.last_move == (i, j):
-                    if self.board[i][j] == 1:
-                        symbol = '⚫'
-                    elif self.board[i][j] == 2:
-                        symbol = '⚪'
-                display += f"{symbol} "
-            display += f"{i + 1:2d}\n"
-
-        # 底部列标题
-        display += "   "
-        for j in range(self.board_size):
-            display += f"{chr(65 + j)} "
-        display += "\n```"
-
-        return display
+        for i, row in enumerate(self.board):
+            cells = [_BOARD_SYMBOLS[cell] for cell in row]
+            if last_move and last_move[0] == i:
+                cells[last_move[1]] = _LAST_MOVE_SYMBOLS[row[last_move[1]]]
+            parts.append(f"{i + 1:2d} {' '.join(cells)} {i + 1:2d}\n")
+
+        parts.append(header)
+        parts.append("\n```")
+        return "".join(parts)
 
     def clone(self) -> 'Gomoku':
         """克隆游戏状态"""
-        new_game = Gomoku(self.player1_id, self.player2_id, self.board_size)
+        # 浅拷贝所有属性，只复制会被修改的棋盘和位棋盘，避免重新执行__init__生成空棋盘和位棋盘
+        new_game = copy.copy(self)
         new_game.board = [row[:] for row in self.board]
-        new_game.current_player = self.current_player
-        new_game.moves_count = self.moves_count
-        new_game.is_finished = self.is_finished
-        new_game.winner = self.winner
-        new_game.last_move = self.last_move
+        new_game._line_bits = {player: [bits[:] for bits in lines] for player, lines in self._line_bits.items()}
         return new_game
 
     def _parse_move(self, move: str) -> Optional[Tuple[int, int]]:
         """解析移动位置字符串，如 "H8" -> (7, 7)"""
-        if not isinstance(move, str) or len(move) < 2:
+        match = _MOVE_RE.fullmatch(move) if isinstance(move, str) else None
+        if not match:
             return None
 
-        move = move.upper().strip()
-
-        # 提取列字母和行数字
-        col_char = move[0]
-        row_str = move[1:]
-
-        # 验证列字母
-        if not col_char.isalpha() or ord(col_char) - ord('A') >= self.board_size:
+        # 转换为数组索引 (0-based)，列字母不区分大小写
+        col = (ord(match.group(1)) | 0x20) - _ORD_A
+        row = int(match.group(2)) - 1
+        board_size = self.board_size
+        if col >= board_size or row < 0 or row >= board_size:
             return None
 
-        # 验证行数字
-        try:
-            row_num = int(row_str)
-            if row_num < 1 or row_num > self.board_size:
-                return None
-        except ValueError:
-            return None
+        return (row, col)
 
-        # 转换为数组索引 (0-based)
-        col = ord(col_char) - ord('A')
-        row = row_num - 1
+    def _build_line_bits(self) -> Dict[int, List[List[int]]]:
+        """根据棋盘生成两个玩家的位棋盘
 
-        return (row, col)
+        每个玩家4组整数：行(位=列)、列(位=行)、主对角线(按row-col分组, 位=行)、副对角线(按row+col分组, 位=行)
+        """
+        size = self.board_size
+        line_bits = {player: [[0] * size, [0] * size, [0] * (2 * size - 1), [0] * (2 * size - 1)]
+                     for player in (1, 2)}
+        for row, cells in enumerate(self.board):
+            for col, cell in enumerate(cells):
+                if cell in line_bits:
+                    self._set_line_bits(cell, row, col, line_bits)
+        return line_bits
+
+    def _set_line_bits(self, player_num: int, row: int, col: int, line_bits=None):
+        """在位棋盘上记录一颗棋子"""
+        rows, cols, diags, anti_diags = (line_bits or self._line_bits)[player_num]
+        rows[row] |= 1 << col
+        cols[col] |= 1 << row
+        diags[row - col + self.board_size - 1] |= 1 << row
+        anti_diags[row + col] |= 1 << row
 
     def _check_winner(self, row: int, col: int) -> bool:
-        """检查在指定位置下棋后是否获胜"""
-        winning_line = self._get_winning_line(row, col)
-        return winning_line is not None
+        """检查在指定位置下棋后是否获胜（位运算判断是否有连续5位）"""
+        player_num = self.board[row][col]
+        if player_num not in self._line_bits:
+            return False
+        rows, cols, diags, anti_diags = self._line_bits[player_num]
+        lines = ((rows[row], col), (cols[col], row), (diags[row - col + self.board_size - 1], row),
+                 (anti_diags[row + col], row))
+        for bits, pos in lines:
+            # 只保留落子点前后4格，窗口内的五连必然经过落子点
+            bits &= _WINDOW_MASK << pos >> 4
+            bits &= bits >> 1
+            bits &= bits >> 2
+            if bits & (bits >> 1):
+                return True
+        return False
 
     def _get_winning_line(self, row: int, col: int) -> list:
         """获取获胜的五子连线位置"""
-        player_num = self.board[row][col]
-
-        # 四个方向：水平、垂直、对角线1、对角线2
-        directions = [
-            (0, 1),  # 水平
-            (1, 0),  # 垂直
-            (1, 1),  # 对角线1
-            (1, -1)  # 对角线2
-        ]
-
-        for dr, dc in directions:
-            positions = [(row, col)]  # 包含当前位置
+        board = self.board
+        size = self.board_size
+        player_num = board[row][col]
+        if not player_num:
+            return None
 
-            # 向一个方向检查
+        for dr, dc in _DIRECTIONS:
+            # 只统计连子数，确认获胜后再生成坐标
             r, c = row + dr, col + dc
-            while (0 <= r < self.board_size and 0 <= c < self.board_size and
-                   self.board[r][c] == player_num):
-                positions.append((r, c))
+            forward = 0
+            while 0 <= r < size and 0 <= c < size and board[r][c] == player_num:
+                forward += 1
                 r, c = r + dr, c + dc
 
-            # 向相反方向检查
             r, c = row - dr, col - dc
-            while (0 <= r < self.board_size and 0 <= c < self.board_size and
-                   self.board[r][c] == player_num):
-                positions.insert(0, (r, c))  # 插入到开头保持顺序
+            back = 0
+            while 0 <= r < size and 0 <= c < size and board[r][c] == player_num:
+                back += 1
                 r, c = r - dr, c - dc
 
-            # 如果连成5个或以上，返回获胜线位置
-            if len(positions) >= 5:
-                return positions[:5]  # 只返回前5个位置
+            # 如果连成5个或以上，返回从连线最前端开始的5个位置
+            if back + forward + 1 >= 5:
+                start_r, start_c = row - dr * back, col - dc * back
+                return [(start_r + dr * i, start_c + dc * i) for i in range(5)]
 
         return None
 
     def _is_board_full(self) -> bool:
         """检查棋盘是否已满"""
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                if self.board[i][j] == 0:
-                    return False
-        return True
+        # 每步落在空位上，步数达到格子总数即为满盘
+        return self.moves_count >= self._max_moves
 
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
@@ -212,7 +259,8 @@ class Gomoku(BaseGame):
             'player_symbols': self.player_symbols,
             'player_numbers': self.player_numbers,
             'player_colors': self.player_colors,
-            'last_move': self.last_move
+            'last_move': self.last_move,
+            'winning_line': self.winning_line
         })
         return data
 
@@ -221,6 +269,7 @@ class Gomoku(BaseGame):
         """从字典创建游戏实例"""
         game = cls(data['player1_id'], data['player2_id'], data.get('board_size', 15))
         game.board = data['board']
+        game._line_bits = game._build_line_bits()
         game.current_player = data['current_player']
         game.moves_count = data['moves_count']
         game.is_finished = data['is_finished']
@@ -229,6 +278,11 @@ class Gomoku(BaseGame):
         game.player_numbers = data['player_numbers']
         game.player_colors = data['player_colors']
         game.last_move = data.get('last_move')
+        if 'winning_line' in data:
+            game.winning_line = data['winning_line']
+        elif game.is_finished and game.winner and game.last_move:
+            # 旧数据没有保存获胜线，加载时计算一次
+            game.winning_line = game._get_winning_line(game.last_move[0], game.last_move[1])
         return game
 
     def get_game_info(self) -> Dict[str, Any]:
@@ -246,7 +300,7 @@ class Gomoku(BaseGame):
             'is_finished': self.is_finished,
             'winner': self.winner,
             'last_move': self.last_move,
-            'available_moves_count': len(self.get_available_moves()) if not self.is_finished else 0
+            'available_moves_count': sum(row.count(0) for row in self.board) if not self.is_finished else 0
         }
 
     def get_html_data(self) -> Dict[str, Any]:
@@ -263,11 +317,6 @@ class Gomoku(BaseGame):
         player1_name = f"用户{self.player1_id[-4:]}" if self.player2_id != 'AI' else "您"
         player2_name = f"用户{self.player2_id[-4:]}" if self.player2_id != 'AI' else "AI"
 
-        # 获取获胜线信息
-        winning_line = None
-        if self.is_finished and self.winner and self.last_move:
-            winning_line = self._get_winning_line(self.last_move[0], self.last_move[1])
-
         return {
             'board': self.board,
             'board_size': self.board_size,
@@ -281,6 +330,6 @@ class Gomoku(BaseGame):
             'winner': self.winner,
             'winner_name': winner_name,
             'last_move': self.last_move,
-            'winning_line': winning_line,
+            'winning_line': self.winning_line,
             'game_duration': '进行中'  # 可以后续添加时间计算
         }
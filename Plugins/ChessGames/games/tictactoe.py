@@ -5,17 +5,41 @@
 from typing import List, Optional, Dict, Any, Tuple
 
 from .base_game import BaseGame, GameResult, MoveResult
+from ..systems.bitboard import TTT_HAS_LINE, TTT_EMPTY_SQUARES, TTT_MASKS_BY_SQUARE, board_to_bitboards
+
+# 位置编号(1-9)对应的坐标(row, col)，下标0不使用
+_POS_TO_RC = (None,) + tuple((row, col) for row in range(3) for col in range(3))
 
 
 class TicTacToe(BaseGame):
     """井字棋游戏类"""
 
+    __slots__ = ('x_bb', 'o_bb')
+
+    # 按轮次(_turn)索引的玩家符号
+    _PLAYER_SYMBOLS = ('X', 'O')
+
+    # 棋盘显示模板，只需代入9个格子的符号
+    _BOARD_SYMBOLS = ('⬜', '❌', '⭕')
+    _BOARD_TEMPLATE = (
+        "```\n井字棋棋盘：\n\n"
+        "   1   2   3\n"
+        "A  {0}  {1}  {2}    A\n"
+        "B  {3}  {4}  {5}    B\n"
+        "C  {6}  {7}  {8}    C\n"
+        "   1   2   3\n\n"
+        "位置编号：\n"
+        "1 2 3\n4 5 6\n7 8 9\n"
+        "```"
+    )
+    _SIMPLE_SYMBOLS = ('·', 'X', 'O')
+    _SIMPLE_TEMPLATE = "{0}|{1}|{2}\n{3}|{4}|{5}\n{6}|{7}|{8}"
+
     def __init__(self, player1_id: str, player2_id: str):
         super().__init__(player1_id, player2_id)
-        # 3x3棋盘，0=空，1=玩家1(X)，2=玩家2(O)
-        self.board = [[0 for _ in range(3)] for _ in range(3)]
-        self.player_symbols = {player1_id: 'X', player2_id: 'O'}
-        self.player_numbers = {player1_id: 1, player2_id: 2}
+        # 位棋盘：玩家1(X)和玩家2(O)各一个9位整数，第i位对应位置i+1
+        self.x_bb = 0
+        self.o_bb = 0
 
     def make_move(self, player_id: str, move: int) -> MoveResult:
         """执行移动
@@ -25,147 +49,133 @@ class TicTacToe(BaseGame):
             move: 移动位置 (1-9)
         """
         if self.is_finished:
-            return MoveResult(GameResult.INVALID, message="\n❌ 游戏已结束")
+            return MoveResult(GameResult.INVALID, message="\n❌ 游戏已结束", board_changed=False)
 
         if not self.is_player_turn(player_id):
-            return MoveResult(GameResult.INVALID, message="\n❌ 不是您的回合")
+            return MoveResult(GameResult.INVALID, message="\n❌ 不是您的回合", board_changed=False)
 
         if not self.is_valid_move(move):
-            return MoveResult(GameResult.INVALID, message="\n❌ 无效的移动位置")
-
-        # 转换位置 (1-9 -> row, col)
-        row, col = self._position_to_coords(move)
+            return MoveResult(GameResult.INVALID, message="\n❌ 无效的移动位置", board_changed=False)
 
         # 执行移动
-        self.board[row][col] = self.player_numbers[player_id]
+        if self._turn == 0:
+            self.x_bb |= 1 << (move - 1)
+        else:
+            self.o_bb |= 1 << (move - 1)
         self.moves_count += 1
 
-        # 检查游戏结果
-        winner = self._check_winner()
+        # 检查游戏结果（只检查经过落子点的连线）
+        winner = self._check_winner(move)
         if winner:
             self.finish_game(winner)
-            symbol = self.player_symbols[winner]
+            symbol = self._PLAYER_SYMBOLS[self._turn]
             return MoveResult(GameResult.WIN, winner, f"\n🎉 玩家 {symbol} 获胜！")
         elif self._is_board_full():
             self.finish_game()
             return MoveResult(GameResult.DRAW, message="\n🤝 平局！")
         else:
             self.switch_player()
-            next_symbol = self.player_symbols[self.current_player]
+            next_symbol = self._PLAYER_SYMBOLS[self._turn]
             return MoveResult(GameResult.CONTINUE, message=f"\n轮到玩家 {next_symbol} 下棋")
 
     def is_valid_move(self, move: int) -> bool:
         """检查移动是否有效"""
-        if not isinstance(move, int) or move < 1 or move > 9:
+        try:
+            return 1 <= move <= 9 and not ((self.x_bb | self.o_bb) >> (move - 1)) & 1
+        except TypeError:
+            # 非整数位置（字符串、None、浮点数等）
             return False
 
-        row, col = self._position_to_coords(move)
-        return self.board[row][col] == 0
+    def _cells(self) -> List[int]:
+        """按位置1-9顺序展开的格子列表，0=空，1=玩家1(X)，2=玩家2(O)"""
+        x_bb, o_bb = self.x_bb, self.o_bb
+        return [1 if x_bb >> i & 1 else 2 if o_bb >> i & 1 else 0 for i in range(9)]
 
-    def get_board_state(self) -> List[List[int]]:
-        """获取棋盘状态"""
-        return [row[:] for row in self.board]
+    @property
+    def board(self) -> List[List[int]]:
+        """3x3棋盘（由位棋盘生成的新列表），0=空，1=玩家1(X)，2=玩家2(O)"""
+        cells = self._cells()
+        return [cells[0:3], cells[3:6], cells[6:9]]
 
-    def get_available_moves(self) -> List[int]:
-        """获取可用的移动位置"""
-        moves = []
-        for i in range(3):
-            for j in range(3):
-                if self.board[i][j] == 0:
-                    moves.append(self._coords_to_position(i, j))
-        return moves
+    @board.setter
+    def board(self, board: List[List[int]]):
+        self.x_bb, self.o_bb = board_to_bitboards(board)
 
-    def get_board_display(self) -> str:
-        """获取棋盘的文本显示"""
-        symbols = {0: '⬜', 1: '❌', 2: '⭕'}
+    @property
+    def player_symbols(self) -> Dict[str, str]:
+        """玩家ID -> 符号（新建的字典，仅用于序列化和外部接口）"""
+        return {self.player1_id: 'X', self.player2_id: 'O'}
 
-        display = "```\n井字棋棋盘：\n\n"
-        display += "   1   2   3\n"
+    @property
+    def player_numbers(self) -> Dict[str, int]:
+        """玩家ID -> 玩家编号（新建的字典，仅用于序列化和外部接口）"""
+        return {self.player1_id: 1, self.player2_id: 2}
 
-        for i in range(3):
-            display += f"{chr(65 + i)}  "
-            for j in range(3):
-                display += f"{symbols[self.board[i][j]]}  "
-            display += f"  {chr(65 + i)}\n"
+    def get_board_state(self) -> Tuple[Tuple[int, ...], ...]:
+        """获取棋盘状态（不可变的元组快照）"""
+        cells = tuple(self._cells())
+        return cells[0:3], cells[3:6], cells[6:9]
 
-        display += "   1   2   3\n\n"
+    def get_board_view(self) -> Tuple[Tuple[int, ...], ...]:
+        """获取棋盘状态（不可变快照，与get_board_state相同）"""
+        return self.get_board_state()
 
-        # 添加位置说明
-        display += "位置编号：\n"
-        display += "1 2 3\n4 5 6\n7 8 9\n"
-        display += "```"
+    def get_available_moves(self) -> List[int]:
+        """获取可用的移动位置"""
+        return list(TTT_EMPTY_SQUARES[self.x_bb | self.o_bb])
 
-        return display
+    def get_board_display(self) -> str:
+        """获取棋盘的文本显示"""
+        return self._BOARD_TEMPLATE.format(*[self._BOARD_SYMBOLS[c] for c in self._cells()])
 
     def get_simple_display(self) -> str:
         """获取简单的棋盘显示（用于快速查看）"""
-        symbols = {0: '·', 1: 'X', 2: 'O'}
-
-        lines = []
-        for i in range(3):
-            line = ""
-            for j in range(3):
-                line += symbols[self.board[i][j]]
-                if j < 2:
-                    line += "|"
-            lines.append(line)
-
-        return "\n".join(lines)
+        return self._SIMPLE_TEMPLATE.format(*[self._SIMPLE_SYMBOLS[c] for c in self._cells()])
 
     def clone(self) -> 'TicTacToe':
         """克隆游戏状态"""
-        new_game = TicTacToe(self.player1_id, self.player2_id)
-        new_game.board = [row[:] for row in self.board]
-        new_game.current_player = self.current_player
+        # 不执行__init__，直接复制各个槽位；位棋盘是整数，玩家映射创建后不再修改，均可直接共享
+        new_game = object.__new__(TicTacToe)
+        new_game.player1_id = self.player1_id
+        new_game.player2_id = self.player2_id
+        new_game._turn = self._turn
         new_game.moves_count = self.moves_count
         new_game.is_finished = self.is_finished
         new_game.winner = self.winner
+        new_game.x_bb = self.x_bb
+        new_game.o_bb = self.o_bb
         return new_game
 
     def _position_to_coords(self, position: int) -> Tuple[int, int]:
         """将位置编号(1-9)转换为坐标(row, col)"""
-        position -= 1  # 转换为0-8
-        return position // 3, position % 3
+        return _POS_TO_RC[position]
 
     def _coords_to_position(self, row: int, col: int) -> int:
         """将坐标(row, col)转换为位置编号(1-9)"""
         return row * 3 + col + 1
 
-    def _check_winner(self) -> Optional[str]:
-        """检查是否有获胜者"""
-        # 检查行
-        for i in range(3):
-            if self.board[i][0] != 0 and self.board[i][0] == self.board[i][1] == self.board[i][2]:
-                return self._get_player_by_number(self.board[i][0])
-
-        # 检查列
-        for j in range(3):
-            if self.board[0][j] != 0 and self.board[0][j] == self.board[1][j] == self.board[2][j]:
-                return self._get_player_by_number(self.board[0][j])
-
-        # 检查对角线
-        if self.board[0][0] != 0 and self.board[0][0] == self.board[1][1] == self.board[2][2]:
-            return self._get_player_by_number(self.board[0][0])
-
-        if self.board[0][2] != 0 and self.board[0][2] == self.board[1][1] == self.board[2][0]:
-            return self._get_player_by_number(self.board[0][2])
+    def _check_winner(self, last_move: Optional[int] = None) -> Optional[str]:
+        """检查是否有获胜者
 
+        Args:
+            last_move: 刚落子的位置(1-9)，给出时只检查当前玩家经过该位置的连线
+        """
+        if last_move is not None:
+            bb = self.o_bb if self._turn else self.x_bb
+            for mask in TTT_MASKS_BY_SQUARE[last_move - 1]:
+                if bb & mask == mask:
+                    return self.current_player
+            return None
+
+        if TTT_HAS_LINE[self.x_bb]:
+            return self.player1_id
+        if TTT_HAS_LINE[self.o_bb]:
+            return self.player2_id
         return None
 
     def _is_board_full(self) -> bool:
-        """检查棋盘是否已满"""
-        for i in range(3):
-            for j in range(3):
-                if self.board[i][j] == 0:
-                    return False
-        return True
-
-    def _get_player_by_number(self, number: int) -> Optional[str]:
-        """根据玩家编号获取玩家ID"""
-        for player_id, player_number in self.player_numbers.items():
-            if player_number == number:
-                return player_id
-        return None
+        """检查棋盘是否已满（落子位置都经过校验，不会重复，9手即满）"""
+        return self.moves_count >= 9
 
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
@@ -181,16 +191,24 @@ class TicTacToe(BaseGame):
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'TicTacToe':
         """从字典创建游戏实例"""
-        game = cls(data['player1_id'], data['player2_id'])
-        game.board = data['board']
-        game.current_player = data['current_player']
-        game.moves_count = data['moves_count']
-        game.is_finished = data['is_finished']
-        game.winner = data['winner']
-        game.player_symbols = data['player_symbols']
-        game.player_numbers = data['player_numbers']
+        player1_id = data['player1_id']
+        x_bb, o_bb = board_to_bitboards(data['board'])
+        turn = 0 if data['current_player'] == player1_id else 1
+        game = object.__new__(cls)
+        game.__setstate__((player1_id, data['player2_id'], x_bb, o_bb, turn,
+                           data['moves_count'], data['is_finished'], data['winner']))
         return game
 
+    def __getstate__(self) -> tuple:
+        """紧凑的位置元组状态（用于pickle/copy）"""
+        return (self.player1_id, self.player2_id, self.x_bb, self.o_bb, self._turn,
+                self.moves_count, self.is_finished, self.winner)
+
+    def __setstate__(self, state: tuple):
+        """从__getstate__的元组恢复状态"""
+        (self.player1_id, self.player2_id, self.x_bb, self.o_bb, self._turn,
+         self.moves_count, self.is_finished, self.winner) = state
+
     def get_game_info(self) -> Dict[str, Any]:
         """获取游戏信息"""
         return {
@@ -210,17 +228,18 @@ class TicTacToe(BaseGame):
 
     def get_html_data(self) -> Dict[str, Any]:
         """获取HTML模板渲染数据"""
+        if self.player2_id == 'AI':
+            player1_name, player2_name = "您", "AI"
+            player1_winner_name, player2_winner_name = "您", "AI"
+        else:
+            p1_short, p2_short = self.player1_id[-4:], self.player2_id[-4:]
+            player1_name, player2_name = f"用户{p1_short}", f"用户{p2_short}"
+            player1_winner_name, player2_winner_name = f"玩家X ({p1_short})", f"玩家O ({p2_short})"
+
         # 确定获胜者名称
         winner_name = None
         if self.winner:
-            if self.winner == self.player1_id:
-                winner_name = f"玩家X ({self.player1_id[-4:]})" if self.player2_id != 'AI' else "您"
-            else:
-                winner_name = f"玩家O ({self.player2_id[-4:]})" if self.player2_id != 'AI' else "AI"
-
-        # 准备玩家名称
-        player1_name = f"用户{self.player1_id[-4:]}" if self.player2_id != 'AI' else "您"
-        player2_name = f"用户{self.player2_id[-4:]}" if self.player2_id != 'AI' else "AI"
+            winner_name = player1_winner_name if self.winner == self.player1_id else player2_winner_name
 
         return {
             'board': self.board,
@@ -2,11 +2,15 @@
 命令处理器
 """
 
+import asyncio
 import json
 import logging
+import re
+import time
 from typing import Dict, Any, List, Optional
 
 from Core.message.builder import MessageBuilder
+from ..core.cache import TTLCache
 from ..core.database import DatabaseManager
 from ..core.game_manager import GameManager, GameSession
 from ..games.gomoku import Gomoku
@@ -14,6 +18,272 @@ from ..games.tictactoe import TicTacToe
 from ..systems.ai import AISystem
 from ..systems.render import RenderSystem
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 游戏结果延迟写入的时间（秒），期间结束的对局合并到同一个事务中保存
+_RESULT_WRITE_DELAY = 0.1
+# 写入失败后重试的最长间隔（秒），重试间隔从_RESULT_WRITE_DELAY开始逐次加倍
+_RESULT_RETRY_MAX_DELAY = 30
+
+# 对局无操作超时的时间（分钟），超时的对局由后台任务清理
+_GAME_TIMEOUT_MINUTES = 10
+
+# 游戏类型显示名称
+_GAME_NAMES = {'tictactoe': '井字棋', 'gomoku': '五子棋'}
+
+# 游戏类型对应的命令前缀
+_GAME_PREFIXES = {'tictactoe': '#', 'gomoku': 'f'}
+
+# 五子棋坐标格式（如H8）：一个字母后跟数字
+_GOMOKU_COORD_RE = re.compile(r'[^\W\d_]\d+')
+
+# 表示对局结束的移动结果（GameResult的值）
+_GAME_OVER_RESULTS = frozenset(('win', 'draw'))
+
+# AI难度名称（支持中文和英文）-> 难度
+_DIFFICULTY_MAP = {
+    '简单': 'easy', 'easy': 'easy',
+    '中等': 'medium', 'medium': 'medium',
+    '困难': 'hard', 'hard': 'hard'
+}
+
+# 井字棋/五子棋通用子命令：参数 -> (动作, 难度)，难度为None的ai命令使用后续参数
+_GAME_COMMANDS = {
+    '简单': ('ai', 'easy'), 'easy': ('ai', 'easy'),
+    '中等': ('ai', 'medium'), 'medium': ('ai', 'medium'),
+    '困难': ('ai', 'hard'), 'hard': ('ai', 'hard'),
+    'ai': ('ai', None),
+    '对战': ('pvp', None), 'pvp': ('pvp', None), 'start': ('pvp', None),
+    '加入': ('join', None), 'join': ('join', None),
+    '帮助': ('help', None), 'help': ('help', None),
+}
+_TTT_COMMANDS = {**_GAME_COMMANDS, '状态': ('status', None), 'status': ('status', None)}
+_GOMOKU_COMMANDS = _GAME_COMMANDS
+
+# 游戏菜单文本
+_GAME_MENU_TEXT = """🎮 棋类游戏菜单
+
+🎯 快速游戏：
+• # - 井字棋AI对战
+• # 对战 - 井字棋人人对战
+• f - 五子棋AI对战
+• f 对战 - 五子棋人人对战
+
+📊 游戏功能：
+• 游戏状态 - 查看当前状态
+• 游戏信息 - 查看个人信息
+• 游戏排行榜 - 查看群组排行
+• 认输 - 认输当前游戏
+
+🎲 难度选择：
+• # 简单/中等/困难 - 井字棋AI难度
+• f 简单/中等/困难 - 五子棋AI难度"""
+
+# 详细帮助文本
+_HELP_TEXT = """🎮 棋类游戏详细帮助
+
+🎯 井字棋 (TicTacToe)：
+• # - 开始AI对战
+• # 对战 - 发起人人对战
+• # 加入 - 加入人人对战
+• # <位置> - 下棋，位置为1-9
+• # [简单/中等/困难] - 指定AI难度
+
+🎯 五子棋 (Gomoku)：
+• f - 开始AI对战
+• f 对战 - 发起人人对战
+• f 加入 - 加入人人对战
+• f <坐标> - 下棋，如 H8
+• f [简单/中等/困难] - 指定AI难度
+
+📊 统计功能：
+• 游戏信息 - 个人游戏统计
+• 游戏排行榜 - 群组排行榜
+• 游戏状态 - 当前游戏状态
+
+🎮 游戏规则：
+• 井字棋：3x3棋盘，连成3个获胜
+• 五子棋：15x15棋盘，连成5个获胜
+• 支持人机对战和玩家对战
+
+💡 使用技巧：
+• 游戏会自动超时清理（10分钟无操作）
+• 可以随时使用 chess surrender 认输
+• AI有三个难度级别可选择"""
+
+# 井字棋帮助文本
+_TTT_HELP_TEXT = """
+🎯 井字棋游戏帮助
+
+🎮 游戏规则：
+• 3x3棋盘，玩家轮流下棋
+• 先连成3个的玩家获胜
+• X先手，O后手
+
+📝 命令格式：
+• # - 开始AI对战（默认中等难度）
+• # <位置> - 下棋，位置1-9
+• # [难度] - 指定难度开始AI对战
+• # 对战 - 发起人人对战（等待1分钟）
+• # 加入 - 加入人人对战
+• 游戏状态 - 查看当前游戏或等待状态
+• 认输 - 认输当前游戏或取消等待
+
+🎯 位置编号：
+1 2 3
+4 5 6
+7 8 9
+
+🤖 AI难度：
+• 简单 - 随机下棋
+• 中等 - 基本策略（默认）
+• 困难 - 高级算法
+
+💡 示例：
+• # 对战 - 发起人人对战
+• # 5 - 在中心位置下棋
+• # 困难 - 与困难AI对战"""
+
+# 五子棋帮助文本
+_GOMOKU_HELP_TEXT = """
+🎯 五子棋游戏帮助
+
+🎮 游戏规则：
+• 15x15棋盘，玩家轮流下棋
+• 先连成5个的玩家获胜
+• 黑棋先手，白棋后手
+
+📝 命令格式：
+• f - 开始AI对战（默认中等难度）
+• f <坐标> - 下棋，如H8
+• f [难度] - 指定难度开始AI对战
+• f 对战 - 发起人人对战（等待1分钟）
+• f 加入 - 加入人人对战
+• 认输 - 认输当前游戏或取消等待
+
+🎯 坐标格式：
+• 列用字母A-O表示
+• 行用数字1-15表示
+• 如：H8表示第8列第8行
+
+🤖 AI难度：
+• 简单 - 随机下棋
+• 中等 - 基本策略（默认）
+• 困难 - 高级算法
+
+💡 示例：
+• f H8 - 在H8位置下棋
+• f 困难 - 与困难AI对战"""
+
+# 等待状态文本（等待/剩余时间在_format_wait_status中代入）
+_WAIT_STATUS_TEMPLATE = """
+⏳ {title}
+
+👤 等待玩家: 用户{user_id}
+⏰ 已等待: {waited_min}分{waited_sec}秒
+⏰ 剩余时间: {remaining_min}分{remaining_sec}秒{footer}"""
+_WAIT_STATUS_FOOTER = """
+
+💡 其他玩家发送 {prefix} 加入 即可开始游戏
+🏳️ 回复『认输』可以取消等待"""
+_ALREADY_WAITING_FOOTER = """
+
+💡 请耐心等待其他玩家加入
+🏳️ 发送 认输 可以取消等待"""
+
+# 对战房间创建后的提示文本
+_ROOM_CREATED_TEMPLATE = """
+🎮 {game_name}对战房间已创建！
+
+👤 发起者: 用户{user_id}
+⏳ 等待对手加入...
+⏰ 等待时间: 1分钟（超时自动取消）
+
+💡 其他玩家发送 {prefix} 加入 来加入对战
+🏳️ 发送 认输 可以取消等待"""
+_ROOM_AUTO_CREATED_TEMPLATE = """
+🎮 没有等待中的对战房间，已为您创建新房间！
+
+👤 房间创建者: 用户{user_id}
+⏳ 等待其他玩家加入...
+⏰ 等待时间: 1分钟（超时自动取消）
+
+💡 其他玩家发送 {prefix} 加入 即可开始对战
+🏳️ 发送 认输 可以取消等待"""
+
+# 加入对战失败的提示文本
+_JOIN_FAILED_TEMPLATE = """
+❌ 加入对战失败
+
+💡 请发送 {prefix} 对战 创建对战房间"""
+
+# 对局开始时棋盘图片的说明文字
+_TTT_PVP_CAPTION = "\n🎮 井字棋对战开始！\n👥 X: 用户{player1_id} \n O: 用户{player2_id}\n💡 轮到 X 下棋，使用 # <位置> 命令"
+_GOMOKU_PVP_CAPTION = "\n🎮 五子棋对战开始！\n{player1_id} (●) vs {player2_id} (○)\n轮到 {player1_id} 下棋"
+_TTT_AI_CAPTION = "\n🎮 井字棋 vs AI 开始！\n👥 X: 您 \n O: AI ({difficulty_desc})\n💡 轮到您下棋，使用 # <位置> 命令"
+_GOMOKU_AI_CAPTION = "\n🎮 五子棋 vs AI 开始！\n👥 ●: 您 \n ○: AI ({difficulty_desc})\n💡 轮到您下棋，使用 f <坐标> 命令"
+
+# 对局开始提示文本（棋盘图片生成失败时使用）
+_TTT_PVP_START_TEMPLATE = """
+🎮 井字棋对战开始！
+
+👥 玩家：
+• X (先手): 用户{player1_id}
+• O (后手): 用户{player2_id}
+
+{board}
+
+💡 轮到 X 下棋，使用 # <位置> 命令"""
+_GOMOKU_PVP_START_TEMPLATE = """
+🎮 五子棋对战开始！
+
+● 黑棋: 用户{player1_id}
+○ 白棋: 用户{player2_id}
+
+轮到 用户{player1_id} 下棋
+请发送坐标，如：f H8"""
+_TTT_AI_START_TEMPLATE = """
+\n🎮 井字棋 vs AI 开始！
+
+👥 玩家：
+• X (先手): 您
+• O (后手): AI ({difficulty_desc})
+
+{board}
+
+💡 提示：轮到您下棋，使用 # <位置> 命令下棋"""
+_GOMOKU_AI_START_TEMPLATE = """
+🎮 五子棋 vs AI 开始！
+
+👥 玩家：
+• ● (黑棋先手): 您
+• ○ (白棋后手): AI ({difficulty_desc})
+
+{board}
+
+💡 提示：轮到您下棋，使用 f <坐标> 命令下棋（如：f H8）"""
+
+
+def _format_wait_status(title: str, user_id: str, waiting_time: int, footer: str = '') -> str:
+    """生成等待状态文本（waiting_time为已等待秒数，等待上限60秒）"""
+    waited_min, waited_sec = divmod(waiting_time, 60)
+    remaining_min, remaining_sec = divmod(max(0, 60 - waiting_time), 60)
+    return _WAIT_STATUS_TEMPLATE.format(
+        title=title, user_id=user_id,
+        waited_min=waited_min, waited_sec=waited_sec,
+        remaining_min=remaining_min, remaining_sec=remaining_sec,
+        footer=footer)
+
+
+def _dumps_game_data(data: Dict[str, Any]) -> str:
+    """序列化游戏数据（安装了orjson时使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data)
+
 
 class CommandHandler:
     """命令处理器"""
@@ -26,6 +296,27 @@ class CommandHandler:
         self.ai_system = ai_system
         self.logger = logger
         self.current_bot_id = None  # 当前处理消息的机器人ID
+        # 机器人APP ID缓存：bot_id -> app_id（只缓存查到的值）
+        self._bot_app_id_cache = TTLCache(maxsize=32, ttl=300)
+        # 统计/排行榜图片缓存：(模板, 宽度, 模板数据JSON) -> 图片base64，数据不变时不重新渲染
+        self._stats_image_cache = TTLCache(maxsize=64, ttl=600)
+        # 待保存的游戏结果，由后台写入任务批量写入数据库
+        self._pending_results: List[Dict[str, Any]] = []
+        self._result_writer: Optional[asyncio.Task] = None
+        # 写入锁在使用时按当前事件循环创建（后台事件循环可能重启）
+        self._result_write_lock: Optional[asyncio.Lock] = None
+        self._result_write_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        # 等待队列超时清理任务（有玩家进入等待队列时启动，队列清空后退出）
+        self._waiting_expiry_task: Optional[asyncio.Task] = None
+        # 对局超时清理任务（创建对局时启动，超时检查堆清空后退出）
+        self._game_timeout_task: Optional[asyncio.Task] = None
+        # AI支持的难度级别
+        self._valid_difficulties = frozenset(ai_system.get_available_difficulties())
+        # 各游戏类型的PvP对局创建方法
+        self._pvp_game_creators = {
+            'tictactoe': self._create_tictactoe_pvp_game,
+            'gomoku': self._create_gomoku_pvp_game,
+        }
 
     def set_current_bot_id(self, bot_id: int):
         """设置当前处理消息的机器人ID"""
@@ -48,7 +339,13 @@ class CommandHandler:
                 # 没有参数，开始AI游戏（默认中等难度）
                 return await self._start_tictactoe_ai_game(user_id, group_id, ['medium'])
 
-            first_arg = args[0].lower()
+            first_arg = args[0]
+
+            # 最常见的情况：单个数字1-9（下棋位置），无需转换大小写和整数
+            if len(first_arg) == 1 and '1' <= first_arg <= '9':
+                return await self._make_tictactoe_move(user_id, group_id, [first_arg])
+
+            first_arg = first_arg.lower()
 
             # 检查是否是数字（下棋位置）
             if first_arg.isdigit():
@@ -58,29 +355,23 @@ class CommandHandler:
                 else:
                     return MessageBuilder.text("\n❌ 位置必须是1-9的数字")
 
-            # 检查是否是难度设置
-            elif first_arg in ['简单', 'easy']:
-                return await self._start_tictactoe_ai_game(user_id, group_id, ['easy'])
-            elif first_arg in ['中等', 'medium']:
-                return await self._start_tictactoe_ai_game(user_id, group_id, ['medium'])
-            elif first_arg in ['困难', 'hard']:
-                return await self._start_tictactoe_ai_game(user_id, group_id, ['hard'])
-
-            # 人人对战命令
-            elif first_arg in ['对战', 'pvp', 'start']:
-                return await self._start_tictactoe_pvp(user_id, group_id)
-            elif first_arg in ['加入', 'join']:
-                return await self._join_tictactoe_pvp(user_id, group_id)
+            command = _TTT_COMMANDS.get(first_arg)
+            if command is None:
+                return MessageBuilder.text("\n❌ 未知的井字棋操作，请使用 游戏菜单 查看帮助")
 
-            # 其他命令
-            elif first_arg in ['状态', 'status']:
+            action, difficulty = command
+            if action == 'ai':
+                # 难度命令直接指定难度，ai命令使用后续参数
+                return await self._start_tictactoe_ai_game(user_id, group_id,
+                                                           [difficulty] if difficulty else args[1:])
+            elif action == 'pvp':
+                return await self._pvp_action(user_id, group_id, 'tictactoe', 'start')
+            elif action == 'join':
+                return await self._pvp_action(user_id, group_id, 'tictactoe', 'join')
+            elif action == 'status':
                 return self._show_waiting_status(user_id, group_id)
-            elif first_arg == 'help' or first_arg == '帮助':
-                return self._show_tictactoe_help()
-            elif first_arg == 'ai':
-                return await self._start_tictactoe_ai_game(user_id, group_id, args[1:])
             else:
-                return MessageBuilder.text("\n❌ 未知的井字棋操作，请使用 游戏菜单 查看帮助")
+                return self._show_tictactoe_help()
 
         except Exception as e:
             self.logger.error(f"处理井字棋命令失败: {e}")
@@ -97,32 +388,24 @@ class CommandHandler:
             first_arg = args[0].upper()
 
             # 检查是否是坐标格式（如H8）
-            if len(first_arg) >= 2 and first_arg[0].isalpha() and first_arg[1:].isdigit():
+            if _GOMOKU_COORD_RE.fullmatch(first_arg):
                 return await self._make_gomoku_move(user_id, group_id, [first_arg])
 
-            first_arg_lower = args[0].lower()
-
-            # 检查是否是难度设置
-            if first_arg_lower in ['简单', 'easy']:
-                return await self._start_gomoku_ai_game(user_id, group_id, ['easy'])
-            elif first_arg_lower in ['中等', 'medium']:
-                return await self._start_gomoku_ai_game(user_id, group_id, ['medium'])
-            elif first_arg_lower in ['困难', 'hard']:
-                return await self._start_gomoku_ai_game(user_id, group_id, ['hard'])
-
-            # 人人对战命令
-            elif first_arg_lower in ['对战', 'pvp', 'start']:
-                return await self._start_gomoku_pvp(user_id, group_id)
-            elif first_arg_lower in ['加入', 'join']:
-                return await self._join_gomoku_pvp(user_id, group_id)
+            command = _GOMOKU_COMMANDS.get(args[0].lower())
+            if command is None:
+                return MessageBuilder.text("\n❌ 未知的五子棋操作，请使用 游戏菜单 查看帮助")
 
-            # 其他命令
-            elif first_arg_lower == 'help' or first_arg_lower == '帮助':
-                return self._show_gomoku_help()
-            elif first_arg_lower == 'ai':
-                return await self._start_gomoku_ai_game(user_id, group_id, args[1:])
+            action, difficulty = command
+            if action == 'ai':
+                # 难度命令直接指定难度，ai命令使用后续参数
+                return await self._start_gomoku_ai_game(user_id, group_id,
+                                                        [difficulty] if difficulty else args[1:])
+            elif action == 'pvp':
+                return await self._pvp_action(user_id, group_id, 'gomoku', 'start')
+            elif action == 'join':
+                return await self._pvp_action(user_id, group_id, 'gomoku', 'join')
             else:
-                return MessageBuilder.text("\n❌ 未知的五子棋操作，请使用 游戏菜单 查看帮助")
+                return self._show_gomoku_help()
 
         except Exception as e:
             self.logger.error(f"处理五子棋命令失败: {e}")
@@ -146,7 +429,7 @@ class CommandHandler:
                     return MessageBuilder.text("\n❌ 您当前没有进行中的游戏或等待中的对战")
 
             # 获取游戏类型名称
-            game_type_name = "井字棋" if game.game_type == "tictactoe" else "五子棋"
+            game_type_name = _GAME_NAMES[game.game_type]
 
             # 处理认输
             if game.is_ai_game:
@@ -155,22 +438,16 @@ class CommandHandler:
                 winner_id = 'AI'
                 game.finish_game(winner_id=winner_id)
 
-                # 保存游戏结果
-                game_data = json.dumps(game.game_state.to_dict() if game.game_state else {})
-                await self._save_game_result(game, winner_id, game_data)
-
-                self.game_manager.remove_game(game.game_id)
+                # 保存游戏结果并移除游戏
+                await self._finalize_game(game, winner_id)
                 return MessageBuilder.text(f"\n🏳️ 您已认输，{game_type_name}游戏结束")
             else:
                 # 人人对战，对手获胜
                 opponent_id = game.get_opponent(user_id)
                 game.finish_game(winner_id=opponent_id)
 
-                # 保存游戏结果
-                game_data = json.dumps(game.game_state.to_dict() if game.game_state else {})
-                await self._save_game_result(game, opponent_id, game_data)
-
-                self.game_manager.remove_game(game.game_id)
+                # 保存游戏结果并移除游戏
+                await self._finalize_game(game, opponent_id)
                 return MessageBuilder.text(f"\n🏳️ 您已认输，对手获胜！{game_type_name}游戏结束")
 
         except Exception as e:
@@ -180,39 +457,26 @@ class CommandHandler:
     def _show_waiting_status(self, user_id: str, group_id: str) -> MessageBuilder:
         """显示等待状态"""
         try:
+            # 一次获取当前游戏和等待状态
+            status = self.game_manager.get_user_status(user_id, group_id)
+
             # 检查当前游戏
-            current_game = self.game_manager.get_user_game(user_id, group_id)
+            current_game = status['current_game']
             if current_game:
-                game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
+                game_type_name = _GAME_NAMES[current_game.game_type]
                 return MessageBuilder.text(f"\n🎮 您正在进行{game_type_name}游戏")
 
             # 检查等待状态
-            ttt_waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'tictactoe')
-            gomoku_waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'gomoku')
+            ttt_waiting_time = status['waiting_times'].get('tictactoe')
+            gomoku_waiting_time = status['waiting_times'].get('gomoku')
 
             if ttt_waiting_time is not None:
-                remaining_time = max(0, 60 - ttt_waiting_time)
-                return MessageBuilder.text(f"""
-⏳ 井字棋等待状态
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {ttt_waiting_time // 60}分{ttt_waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒
-
-💡 其他玩家发送 # 加入 即可开始游戏
-🏳️ 回复『认输』可以取消等待""")
+                return MessageBuilder.text(_format_wait_status(
+                    "井字棋等待状态", user_id, ttt_waiting_time, _WAIT_STATUS_FOOTER.format(prefix='#')))
 
             elif gomoku_waiting_time is not None:
-                remaining_time = max(0, 60 - gomoku_waiting_time)
-                return MessageBuilder.text(f"""
-⏳ 五子棋等待状态
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {gomoku_waiting_time // 60}分{gomoku_waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒
-
-💡 其他玩家发送 f 加入 即可开始游戏
-🏳️ 回复『认输』可以取消等待""")
+                return MessageBuilder.text(_format_wait_status(
+                    "五子棋等待状态", user_id, gomoku_waiting_time, _WAIT_STATUS_FOOTER.format(prefix='f')))
 
             else:
                 return MessageBuilder.text("\n📋 您当前没有进行中的游戏或等待中的对战")
@@ -223,90 +487,90 @@ class CommandHandler:
 
     def _get_bot_app_id(self, bot_id: int = None) -> str:
         """获取机器人APP ID"""
-        try:
-            # 如果没有传入bot_id，使用当前的bot_id
-            if bot_id is None:
-                bot_id = self.current_bot_id
-
-            # 尝试从bot_manager获取指定机器人的APP ID
-            from BluePrints.admin.bots import get_bot_manager
-            bot_manager = get_bot_manager()
-
-            if bot_manager and hasattr(bot_manager, 'adapters'):
-                # 如果指定了bot_id，优先获取该机器人的APP ID
-                if bot_id and bot_id in bot_manager.adapters:
-                    adapter = bot_manager.adapters[bot_id]
-                    if hasattr(adapter, 'app_id') and adapter.app_id:
-                        return str(adapter.app_id)
-
-                # 否则获取第一个可用的适配器
-                for current_bot_id, adapter in bot_manager.adapters.items():
-                    if hasattr(adapter, 'app_id') and adapter.app_id:
-                        return str(adapter.app_id)
-
-            # 如果无法从适配器获取，尝试从数据库获取
-            try:
-                from Models.SQL.Bot import Bot
-                if bot_id:
-                    # 获取指定机器人的APP ID
-                    bot = Bot.query.filter_by(id=bot_id, is_active=True).first()
-                else:
-                    # 获取第一个激活的机器人
-                    bot = Bot.query.filter_by(is_active=True).first()
+        # 如果没有传入bot_id，使用当前的bot_id
+        if bot_id is None:
+            bot_id = self.current_bot_id
 
-                if bot and bot.app_id:
-                    return str(bot.app_id)
-            except:
-                pass
-
-            # 默认返回示例APP ID
-            return '102019618'
+        app_id = self._bot_app_id_cache.get(bot_id)
+        if app_id is not None:
+            return app_id
 
+        try:
+            app_id = self._lookup_bot_app_id(bot_id)
         except Exception as e:
             self.logger.error(f"获取机器人APP ID失败: {e}")
-            return '102019618'  # 返回默认值
-
-    def _show_game_menu(self, user_id: str, group_id: str) -> MessageBuilder:
-        """显示游戏菜单"""
-        # 检查用户是否有进行中的游戏
-        current_game = self.game_manager.get_user_game(user_id, group_id)
+            app_id = None
 
-        menu_text = """🎮 棋类游戏菜单
+        if app_id is None:
+            # 默认返回示例APP ID（不缓存，以便适配器就绪后重新获取）
+            return '102019618'
 
-🎯 快速游戏：
-• # - 井字棋AI对战
-• # 对战 - 井字棋人人对战
-• f - 五子棋AI对战
-• f 对战 - 五子棋人人对战
+        self._bot_app_id_cache.set(bot_id, app_id)
+        return app_id
+
+    def _lookup_bot_app_id(self, bot_id: Optional[int]) -> Optional[str]:
+        """从适配器或数据库查询机器人APP ID，查不到时返回None
+
+        管理模块延迟导入，避免插件加载时引入Flask管理后台（及循环导入），导入失败只影响头像显示
+        """
+        # 尝试从bot_manager获取指定机器人的APP ID
+        from BluePrints.admin.bots import get_bot_manager
+        bot_manager = get_bot_manager()
+
+        adapters = getattr(bot_manager, 'adapters', None) if bot_manager else None
+        if adapters is not None:
+            # 如果指定了bot_id，优先获取该机器人的APP ID
+            if bot_id:
+                app_id = getattr(adapters.get(bot_id), 'app_id', None)
+                if app_id:
+                    return str(app_id)
+
+            # 否则获取第一个可用的适配器
+            for adapter in adapters.values():
+                app_id = getattr(adapter, 'app_id', None)
+                if app_id:
+                    return str(app_id)
+
+        # 如果无法从适配器获取，尝试从数据库获取
+        try:
+            from Models.SQL.Bot import Bot
+            if bot_id:
+                # 获取指定机器人的APP ID
+                bot = Bot.query.filter_by(id=bot_id, is_active=True).first()
+            else:
+                # 获取第一个激活的机器人
+                bot = Bot.query.filter_by(is_active=True).first()
 
-📊 游戏功能：
-• 游戏状态 - 查看当前状态
-• 游戏信息 - 查看个人信息
-• 游戏排行榜 - 查看群组排行
-• 认输 - 认输当前游戏
+            if bot and bot.app_id:
+                return str(bot.app_id)
+        except:
+            pass
 
-🎲 难度选择：
-• # 简单/中等/困难 - 井字棋AI难度
-• f 简单/中等/困难 - 五子棋AI难度"""
+        return None
 
-        if current_game:
-            game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
-            menu_text += f"\n\n🎲 当前游戏：\n正在进行 {game_type_name} 游戏"
+    def _show_game_menu(self, user_id: str, group_id: str) -> MessageBuilder:
+        """显示游戏菜单"""
+        # 检查用户是否有进行中的游戏
+        current_game = self.game_manager.get_user_game(user_id, group_id)
 
-            if current_game.is_player_turn(user_id):
-                menu_text += " (轮到您下棋)"
-            else:
-                menu_text += " (等待对手)"
+        if not current_game:
+            return MessageBuilder.text(_GAME_MENU_TEXT)
 
-        return MessageBuilder.text(menu_text)
+        # 只拼接当前游戏部分
+        game_type_name = _GAME_NAMES[current_game.game_type]
+        turn_text = " (轮到您下棋)" if current_game.is_player_turn(user_id) else " (等待对手)"
+        return MessageBuilder.text(f"{_GAME_MENU_TEXT}\n\n🎲 当前游戏：\n正在进行 {game_type_name} 游戏{turn_text}")
 
     async def _show_game_status_text(self, user_id: str, group_id: str) -> MessageBuilder:
         """显示游戏状态（文字版）"""
         try:
+            # 一次获取当前游戏和等待状态
+            status = self.game_manager.get_user_status(user_id, group_id)
+
             # 检查当前游戏
-            current_game = self.game_manager.get_user_game(user_id, group_id)
+            current_game = status['current_game']
             if current_game:
-                game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
+                game_type_name = _GAME_NAMES[current_game.game_type]
                 status_text = f"🎮 您正在进行{game_type_name}游戏\n"
 
                 if current_game.is_ai_game:
@@ -323,26 +587,14 @@ class CommandHandler:
                 return MessageBuilder.text(status_text)
 
             # 检查等待状态
-            ttt_waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'tictactoe')
-            gomoku_waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'gomoku')
+            ttt_waiting_time = status['waiting_times'].get('tictactoe')
+            gomoku_waiting_time = status['waiting_times'].get('gomoku')
 
             if ttt_waiting_time is not None:
-                remaining_time = max(0, 60 - ttt_waiting_time)
-                return MessageBuilder.text(f"""
-⏳ 井字棋等待状态
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {ttt_waiting_time // 60}分{ttt_waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒""")
+                return MessageBuilder.text(_format_wait_status("井字棋等待状态", user_id, ttt_waiting_time))
 
             elif gomoku_waiting_time is not None:
-                remaining_time = max(0, 60 - gomoku_waiting_time)
-                return MessageBuilder.text(f"""
-⏳ 五子棋等待状态
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {gomoku_waiting_time // 60}分{gomoku_waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒""")
+                return MessageBuilder.text(_format_wait_status("五子棋等待状态", user_id, gomoku_waiting_time))
 
             else:
                 return MessageBuilder.text("📋 您当前没有进行中的游戏或等待中的对战")
@@ -351,46 +603,56 @@ class CommandHandler:
             self.logger.error(f"显示游戏状态失败: {e}")
             return MessageBuilder.text("\n❌ 获取状态失败，请稍后重试")
 
+    async def _render_stats_image(self, template_name: str, html_data: Dict[str, Any], width: int) -> str:
+        """渲染统计类图片（模板数据与上次相同时直接复用已渲染的图片）"""
+        key = (template_name, width, _dumps_game_data(html_data))
+        image_data = self._stats_image_cache.get(key)
+        if image_data is None:
+            image_data = await self.render_system.render_to_image(template_name, html_data, width=width)
+            # 渲染失败不缓存
+            if image_data:
+                self._stats_image_cache.set(key, image_data)
+        return image_data
+
     async def _show_user_stats_html(self, user_id: str, group_id: str) -> MessageBuilder:
         """显示用户游戏信息（HTML版）"""
         try:
-            # 获取用户统计数据
-            ttt_stats = self.db_manager.get_user_stats(user_id, group_id, 'tictactoe')
-            gomoku_stats = self.db_manager.get_user_stats(user_id, group_id, 'gomoku')
+            await self.flush_game_results()
+
+            # 获取用户统计数据（两次查询在线程中并发执行，不阻塞事件循环）
+            ttt_stats, gomoku_stats = await asyncio.gather(
+                asyncio.to_thread(self.db_manager.get_user_stats, user_id, group_id, 'tictactoe'),
+                asyncio.to_thread(self.db_manager.get_user_stats, user_id, group_id, 'gomoku'))
 
             # 准备HTML数据
             html_data = {
                 'user_id': user_id,
                 'bot_app_id': self._get_bot_app_id(),
                 'ttt_stats': {
-                    'total_games': ttt_stats.total_games if ttt_stats else 0,
-                    'wins': ttt_stats.wins if ttt_stats else 0,
-                    'losses': ttt_stats.losses if ttt_stats else 0,
-                    'draws': ttt_stats.draws if ttt_stats else 0,
-                    'win_rate': round((
-                                                  ttt_stats.wins / ttt_stats.total_games * 100) if ttt_stats and ttt_stats.total_games > 0 else 0,
-                                      1),
-                    'best_streak': ttt_stats.best_streak if ttt_stats else 0,
-                    'current_streak': ttt_stats.current_streak if ttt_stats else 0,
+                    'total_games': ttt_stats['total_games'] if ttt_stats else 0,
+                    'wins': ttt_stats['wins'] if ttt_stats else 0,
+                    'losses': ttt_stats['losses'] if ttt_stats else 0,
+                    'draws': ttt_stats['draws'] if ttt_stats else 0,
+                    'win_rate': round(ttt_stats['win_rate'], 1) if ttt_stats else 0,
+                    'best_streak': ttt_stats['best_streak'] if ttt_stats else 0,
+                    'current_streak': ttt_stats['current_streak'] if ttt_stats else 0,
                 },
                 'gomoku_stats': {
-                    'total_games': gomoku_stats.total_games if gomoku_stats else 0,
-                    'wins': gomoku_stats.wins if gomoku_stats else 0,
-                    'losses': gomoku_stats.losses if gomoku_stats else 0,
-                    'draws': gomoku_stats.draws if gomoku_stats else 0,
-                    'win_rate': round((
-                                                  gomoku_stats.wins / gomoku_stats.total_games * 100) if gomoku_stats and gomoku_stats.total_games > 0 else 0,
-                                      1),
-                    'best_streak': gomoku_stats.best_streak if gomoku_stats else 0,
-                    'current_streak': gomoku_stats.current_streak if gomoku_stats else 0,
+                    'total_games': gomoku_stats['total_games'] if gomoku_stats else 0,
+                    'wins': gomoku_stats['wins'] if gomoku_stats else 0,
+                    'losses': gomoku_stats['losses'] if gomoku_stats else 0,
+                    'draws': gomoku_stats['draws'] if gomoku_stats else 0,
+                    'win_rate': round(gomoku_stats['win_rate'], 1) if gomoku_stats else 0,
+                    'best_streak': gomoku_stats['best_streak'] if gomoku_stats else 0,
+                    'current_streak': gomoku_stats['current_streak'] if gomoku_stats else 0,
                 }
             }
 
             # 渲染HTML
-            image_data = await self.render_system.render_to_image('user_stats.html', html_data, width=600)
+            image_data = await self._render_stats_image('user_stats.html', html_data, width=600)
 
             if image_data:
-                caption = f"\n🎮 游戏信息"
+                caption = "\n🎮 游戏信息"
                 return MessageBuilder.image(base64_data=image_data, caption=caption)
             else:
                 # 回退到文字版本
@@ -405,35 +667,45 @@ class CommandHandler:
         stats_text = f"🎮 游戏信息\n\n"
 
         # 井字棋统计
-        if ttt_stats and ttt_stats.total_games > 0:
-            win_rate = round(ttt_stats.wins / ttt_stats.total_games * 100, 1)
+        if ttt_stats and ttt_stats['total_games'] > 0:
+            win_rate = round(ttt_stats['win_rate'], 1)
             stats_text += f"🎯 井字棋：\n"
-            stats_text += f"• 总局数：{ttt_stats.total_games}\n"
-            stats_text += f"• 胜率：{win_rate}% ({ttt_stats.wins}胜{ttt_stats.losses}负{ttt_stats.draws}平)\n"
-            stats_text += f"• 最佳连胜：{ttt_stats.best_streak}\n"
-            stats_text += f"• 当前连胜：{ttt_stats.current_streak}\n\n"
+            stats_text += f"• 总局数：{ttt_stats['total_games']}\n"
+            stats_text += f"• 胜率：{win_rate}% ({ttt_stats['wins']}胜{ttt_stats['losses']}负{ttt_stats['draws']}平)\n"
+            stats_text += f"• 最佳连胜：{ttt_stats['best_streak']}\n"
+            stats_text += f"• 当前连胜：{ttt_stats['current_streak']}\n\n"
         else:
             stats_text += "🎯 井字棋：暂无记录\n\n"
 
         # 五子棋统计
-        if gomoku_stats and gomoku_stats.total_games > 0:
-            win_rate = round(gomoku_stats.wins / gomoku_stats.total_games * 100, 1)
+        if gomoku_stats and gomoku_stats['total_games'] > 0:
+            win_rate = round(gomoku_stats['win_rate'], 1)
             stats_text += f"🎲 五子棋：\n"
-            stats_text += f"• 总局数：{gomoku_stats.total_games}\n"
-            stats_text += f"• 胜率：{win_rate}% ({gomoku_stats.wins}胜{gomoku_stats.losses}负{gomoku_stats.draws}平)\n"
-            stats_text += f"• 最佳连胜：{gomoku_stats.best_streak}\n"
-            stats_text += f"• 当前连胜：{gomoku_stats.current_streak}"
+            stats_text += f"• 总局数：{gomoku_stats['total_games']}\n"
+            stats_text += f"• 胜率：{win_rate}% ({gomoku_stats['wins']}胜{gomoku_stats['losses']}负{gomoku_stats['draws']}平)\n"
+            stats_text += f"• 最佳连胜：{gomoku_stats['best_streak']}\n"
+            stats_text += f"• 当前连胜：{gomoku_stats['current_streak']}"
         else:
             stats_text += "🎲 五子棋：暂无记录"
 
         return MessageBuilder.text(stats_text)
 
+    @staticmethod
+    def _ranking_entry(rank: int, stats) -> Dict[str, Any]:
+        """排行榜单行数据（胜率已由SQL计算，这里只取一位小数）"""
+        entry = {'rank': rank, **dict(stats)}
+        entry['win_rate'] = round(entry['win_rate'], 1)
+        return entry
+
     async def _show_ranking_html(self, group_id: str, args: List[str]) -> MessageBuilder:
         """显示排行榜（HTML版）"""
         try:
-            # 获取两种游戏的排行榜数据
-            ttt_rankings = self.db_manager.get_group_ranking(group_id, 'tictactoe', limit=10)
-            gomoku_rankings = self.db_manager.get_group_ranking(group_id, 'gomoku', limit=10)
+            await self.flush_game_results()
+
+            # 获取两种游戏的排行榜数据（两次查询在线程中并发执行，不阻塞事件循环）
+            ttt_rankings, gomoku_rankings = await asyncio.gather(
+                asyncio.to_thread(self.db_manager.get_group_ranking, group_id, 'tictactoe', limit=10),
+                asyncio.to_thread(self.db_manager.get_group_ranking, group_id, 'gomoku', limit=10))
 
             # 准备HTML数据
             html_data = {
@@ -444,38 +716,16 @@ class CommandHandler:
             }
 
             # 处理井字棋排行榜
-            for i, stats in enumerate(ttt_rankings, 1):
-                win_rate = round((stats.wins / stats.total_games * 100) if stats.total_games > 0 else 0, 1)
-                html_data['ttt_rankings'].append({
-                    'rank': i,
-                    'user_id': stats.user_id,
-                    'total_games': stats.total_games,
-                    'wins': stats.wins,
-                    'losses': stats.losses,
-                    'draws': stats.draws,
-                    'win_rate': win_rate,
-                    'best_streak': stats.best_streak
-                })
+            html_data['ttt_rankings'] = [self._ranking_entry(i, stats) for i, stats in enumerate(ttt_rankings, 1)]
 
             # 处理五子棋排行榜
-            for i, stats in enumerate(gomoku_rankings, 1):
-                win_rate = round((stats.wins / stats.total_games * 100) if stats.total_games > 0 else 0, 1)
-                html_data['gomoku_rankings'].append({
-                    'rank': i,
-                    'user_id': stats.user_id,
-                    'total_games': stats.total_games,
-                    'wins': stats.wins,
-                    'losses': stats.losses,
-                    'draws': stats.draws,
-                    'win_rate': win_rate,
-                    'best_streak': stats.best_streak
-                })
+            html_data['gomoku_rankings'] = [self._ranking_entry(i, stats) for i, stats in enumerate(gomoku_rankings, 1)]
 
             # 渲染HTML
-            image_data = await self.render_system.render_to_image('ranking.html', html_data, width=800)
+            image_data = await self._render_stats_image('ranking.html', html_data, width=800)
 
             if image_data:
-                caption = f"\n🏆 群组排行榜 TOP10"
+                caption = "\n🏆 群组排行榜 TOP10"
                 return MessageBuilder.image(base64_data=image_data, caption=caption)
             else:
                 # 回退到文字版本
@@ -493,125 +743,32 @@ class CommandHandler:
         ranking_text += "🎯 井字棋排行榜：\n"
         if ttt_rankings:
             for i, stats in enumerate(ttt_rankings[:10], 1):
-                win_rate = round((stats.wins / stats.total_games * 100) if stats.total_games > 0 else 0, 1)
-                ranking_text += f"{i}. 用户{stats.user_id} - {win_rate}% ({stats.wins}胜)\n"
+                win_rate = round(stats['win_rate'], 1)
+                ranking_text += f"{i}. 用户{stats['user_id']} - {win_rate}% ({stats['wins']}胜)\n"
         else:
             ranking_text += "暂无数据\n"
 
         ranking_text += "\n🎲 五子棋排行榜：\n"
         if gomoku_rankings:
             for i, stats in enumerate(gomoku_rankings[:10], 1):
-                win_rate = round((stats.wins / stats.total_games * 100) if stats.total_games > 0 else 0, 1)
-                ranking_text += f"{i}. 用户{stats.user_id} - {win_rate}% ({stats.wins}胜)\n"
+                win_rate = round(stats['win_rate'], 1)
+                ranking_text += f"{i}. 用户{stats['user_id']} - {win_rate}% ({stats['wins']}胜)\n"
         else:
             ranking_text += "暂无数据"
 
         return MessageBuilder.text(ranking_text)
 
     def _show_help(self) -> MessageBuilder:
-        """显示详细帮助"""
-        help_text = """🎮 棋类游戏详细帮助
-
-🎯 井字棋 (TicTacToe)：
-• # - 开始AI对战
-• # 对战 - 发起人人对战
-• # 加入 - 加入人人对战
-• # <位置> - 下棋，位置为1-9
-• # [简单/中等/困难] - 指定AI难度
-
-🎯 五子棋 (Gomoku)：
-• f - 开始AI对战
-• f 对战 - 发起人人对战
-• f 加入 - 加入人人对战
-• f <坐标> - 下棋，如 H8
-• f [简单/中等/困难] - 指定AI难度
-
-📊 统计功能：
-• 游戏信息 - 个人游戏统计
-• 游戏排行榜 - 群组排行榜
-• 游戏状态 - 当前游戏状态
-
-🎮 游戏规则：
-• 井字棋：3x3棋盘，连成3个获胜
-• 五子棋：15x15棋盘，连成5个获胜
-• 支持人机对战和玩家对战
-
-💡 使用技巧：
-• 游戏会自动超时清理（10分钟无操作）
-• 可以随时使用 chess surrender 认输
-• AI有三个难度级别可选择"""
-
-        return MessageBuilder.text(help_text)
-
-    def _show_tictactoe_help(self) -> MessageBuilder:
-        """显示井字棋帮助"""
-        help_text = """
-🎯 井字棋游戏帮助
-
-🎮 游戏规则：
-• 3x3棋盘，玩家轮流下棋
-• 先连成3个的玩家获胜
-• X先手，O后手
-
-📝 命令格式：
-• # - 开始AI对战（默认中等难度）
-• # <位置> - 下棋，位置1-9
-• # [难度] - 指定难度开始AI对战
-• # 对战 - 发起人人对战（等待1分钟）
-• # 加入 - 加入人人对战
-• 游戏状态 - 查看当前游戏或等待状态
-• 认输 - 认输当前游戏或取消等待
-
-🎯 位置编号：
-1 2 3
-4 5 6
-7 8 9
-
-🤖 AI难度：
-• 简单 - 随机下棋
-• 中等 - 基本策略（默认）
-• 困难 - 高级算法
-
-💡 示例：
-• # 对战 - 发起人人对战
-• # 5 - 在中心位置下棋
-• # 困难 - 与困难AI对战"""
-
-        return MessageBuilder.text(help_text)
-
-    def _show_gomoku_help(self) -> MessageBuilder:
-        """显示五子棋帮助"""
-        help_text = """
-🎯 五子棋游戏帮助
-
-🎮 游戏规则：
-• 15x15棋盘，玩家轮流下棋
-• 先连成5个的玩家获胜
-• 黑棋先手，白棋后手
-
-📝 命令格式：
-• f - 开始AI对战（默认中等难度）
-• f <坐标> - 下棋，如H8
-• f [难度] - 指定难度开始AI对战
-• f 对战 - 发起人人对战（等待1分钟）
-• f 加入 - 加入人人对战
-• 认输 - 认输当前游戏或取消等待
-
-🎯 坐标格式：
-• 列用字母A-O表示
-• 行用数字1-15表示
-• 如：H8表示第8列第8行
-
-🤖 AI难度：
-• 简单 - 随机下棋
-• 中等 - 基本策略（默认）
-• 困难 - 高级算法
-
-💡 示例：
-• f H8 - 在H8位置下棋
-• f 困难 - 与困难AI对战"""
+        """显示详细帮助"""
+        return MessageBuilder.text(_HELP_TEXT)
+
+    def _show_tictactoe_help(self) -> MessageBuilder:
+        """显示井字棋帮助"""
+        return MessageBuilder.text(_TTT_HELP_TEXT)
 
-        return MessageBuilder.text(help_text)
+    def _show_gomoku_help(self) -> MessageBuilder:
+        """显示五子棋帮助"""
+        return MessageBuilder.text(_GOMOKU_HELP_TEXT)
 
     async def _show_game_status(self, user_id: str, group_id: str) -> MessageBuilder:
         """显示游戏状态"""
@@ -620,7 +777,7 @@ class CommandHandler:
         if not current_game:
             return MessageBuilder.text("❌ 您当前没有进行中的游戏")
 
-        game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
+        game_type_name = _GAME_NAMES[current_game.game_type]
 
         # 获取对手信息
         opponent_id = current_game.get_opponent(user_id)
@@ -644,6 +801,8 @@ class CommandHandler:
     async def _show_user_stats(self, user_id: str, group_id: str) -> MessageBuilder:
         """显示用户统计"""
         try:
+            await self.flush_game_results()
+
             # 获取井字棋统计
             ttt_stats = self.db_manager.get_user_stats(user_id, group_id, 'tictactoe')
             gomoku_stats = self.db_manager.get_user_stats(user_id, group_id, 'gomoku')
@@ -651,28 +810,28 @@ class CommandHandler:
             stats_text = f"📊 个人游戏统计\n\n"
 
             # 井字棋统计
-            if ttt_stats and ttt_stats.total_games > 0:
-                win_rate = (ttt_stats.wins / ttt_stats.total_games * 100) if ttt_stats.total_games > 0 else 0
+            if ttt_stats and ttt_stats['total_games'] > 0:
+                win_rate = ttt_stats['win_rate']
                 stats_text += f"""🎯 井字棋：
-• 总局数：{ttt_stats.total_games}
-• 胜利：{ttt_stats.wins} \n 失败：{ttt_stats.losses} \n 平局：{ttt_stats.draws}
+• 总局数：{ttt_stats['total_games']}
+• 胜利：{ttt_stats['wins']} \n 失败：{ttt_stats['losses']} \n 平局：{ttt_stats['draws']}
 • 胜率：{win_rate:.1f}%
-• 最佳连胜：{ttt_stats.best_streak}
-• 当前连胜：{ttt_stats.current_streak}
+• 最佳连胜：{ttt_stats['best_streak']}
+• 当前连胜：{ttt_stats['current_streak']}
 
 """
             else:
                 stats_text += "🎯 井字棋：暂无游戏记录\n\n"
 
             # 五子棋统计
-            if gomoku_stats and gomoku_stats.total_games > 0:
-                win_rate = (gomoku_stats.wins / gomoku_stats.total_games * 100) if gomoku_stats.total_games > 0 else 0
+            if gomoku_stats and gomoku_stats['total_games'] > 0:
+                win_rate = gomoku_stats['win_rate']
                 stats_text += f"""🎯 五子棋：
-• 总局数：{gomoku_stats.total_games}
-• 胜利：{gomoku_stats.wins} \n 失败：{gomoku_stats.losses} \n 平局：{gomoku_stats.draws}
+• 总局数：{gomoku_stats['total_games']}
+• 胜利：{gomoku_stats['wins']} \n 失败：{gomoku_stats['losses']} \n 平局：{gomoku_stats['draws']}
 • 胜率：{win_rate:.1f}%
-• 最佳连胜：{gomoku_stats.best_streak}
-• 当前连胜：{gomoku_stats.current_streak}"""
+• 最佳连胜：{gomoku_stats['best_streak']}
+• 当前连胜：{gomoku_stats['current_streak']}"""
             else:
                 stats_text += "🎯 五子棋：暂无游戏记录"
 
@@ -686,21 +845,21 @@ class CommandHandler:
         """显示排行榜"""
         try:
             game_type = args[0] if args else 'tictactoe'
-            if game_type not in ['tictactoe', 'gomoku']:
+            if game_type not in _GAME_NAMES:
                 return MessageBuilder.text("❌ 请指定游戏类型：tictactoe 或 gomoku")
 
+            await self.flush_game_results()
             rankings = self.db_manager.get_group_ranking(group_id, game_type, 10)
 
+            game_name = _GAME_NAMES[game_type]
             if not rankings:
-                game_name = "井字棋" if game_type == "tictactoe" else "五子棋"
                 return MessageBuilder.text(f"❌ 本群暂无{game_name}游戏记录")
 
-            game_name = "井字棋" if game_type == "tictactoe" else "五子棋"
             rank_text = f"🏆 {game_name}排行榜\n\n"
 
             for i, stats in enumerate(rankings, 1):
-                win_rate = (stats.wins / stats.total_games * 100) if stats.total_games > 0 else 0
-                user_display = f"用户{stats.user_id}"
+                win_rate = stats['win_rate']
+                user_display = f"用户{stats['user_id']}"
 
                 if i <= 3:
                     medals = ["🥇", "🥈", "🥉"]
@@ -708,7 +867,7 @@ class CommandHandler:
                 else:
                     rank_text += f"{i}. {user_display}\n"
 
-                rank_text += f"   胜利：{stats.wins} \n 胜率：{win_rate:.1f}% \n 连胜：{stats.best_streak}\n\n"
+                rank_text += f"   胜利：{stats['wins']} \n 胜率：{win_rate:.1f}% \n 连胜：{stats['best_streak']}\n\n"
 
             return MessageBuilder.text(rank_text)
 
@@ -716,201 +875,157 @@ class CommandHandler:
             self.logger.error(f"获取排行榜失败: {e}")
             return MessageBuilder.text("❌ 获取排行榜失败")
 
-    async def _handle_surrender(self, user_id: str, group_id: str) -> MessageBuilder:
-        """处理认输"""
-        try:
-            current_game = self.game_manager.get_user_game(user_id, group_id)
-
-            if not current_game:
-                return MessageBuilder.text("❌ 您当前没有进行中的游戏")
-
-            # 确定获胜者
-            opponent_id = current_game.get_opponent(user_id)
-            winner_id = opponent_id if opponent_id != "AI" else None
-
-            # 保存游戏记录
-            game_data = json.dumps(current_game.game_state.to_dict() if current_game.game_state else {})
-            await self._save_game_result(current_game, winner_id, game_data)
-
-            # 移除游戏
-            self.game_manager.remove_game(current_game.game_id)
-
-            game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
-
-            if opponent_id == "AI":
-                return MessageBuilder.text(f"\n🏳️ 您已认输，{game_type_name}游戏结束")
-            else:
-                return MessageBuilder.text(f"\n🏳️ 您已认输，对手获胜！{game_type_name}游戏结束")
-
-        except Exception as e:
-            self.logger.error(f"处理认输失败: {e}")
-            return MessageBuilder.text("❌ 认输处理失败")
-
-    async def _save_game_result(self, session: GameSession, winner_id: Optional[str], game_data: str):
-        """保存游戏结果"""
+    async def _finalize_game(self, session: GameSession, winner_id: Optional[str]):
+        """保存已结束对局的结果并移除游戏"""
+        game = session.game_state
+        game_data = _dumps_game_data(game.to_dict()) if game else None
+        await self._save_game_result(session, winner_id, game_data)
+        self.game_manager.remove_game(session.game_id)
+
+    async def _save_game_result(self, session: GameSession, winner_id: Optional[str], game_data: Optional[str]):
+        """保存游戏结果（加入写入队列，稍后由后台任务批量写入，不阻塞当前命令）"""
+        # AI游戏只更新真实玩家统计
+        self._pending_results.append({
+            'game_type': session.game_type,
+            'player1_id': session.player1_id,
+            'player2_id': session.player2_id,
+            'group_id': session.group_id,
+            'winner_id': winner_id,
+            'moves_count': session.moves_count,
+            'game_data': game_data,
+            'is_ai_game': session.is_ai_game,
+        })
+        self._ensure_task('_result_writer', self._write_results_later)
+
+    async def _write_results_later(self):
+        """等待一小段时间，把期间结束的对局一起写入数据库；写入失败时逐次加倍间隔重试"""
+        delay = _RESULT_WRITE_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            if await self.flush_game_results():
+                return
+            delay = min(delay * 2, _RESULT_RETRY_MAX_DELAY)
+
+    async def close(self):
+        """停止后台任务，保存剩余的游戏结果并关闭数据库连接（插件禁用时调用）"""
+        for attr in ('_waiting_expiry_task', '_game_timeout_task', '_result_writer'):
+            task = getattr(self, attr)
+            setattr(self, attr, None)
+            if task is not None and not task.done():
+                task.cancel()
+        await self.flush_game_results()
+        self.db_manager.close()
+
+    async def flush_game_results(self) -> bool:
+        """立即写入所有待保存的游戏结果（查询战绩前调用，保证能查到刚结束的对局）
+
+        Returns:
+            是否已全部写入；写入失败时结果放回待保存队列的开头，等待下次重试
+        """
+        async with self._get_result_write_lock():
+            if not self._pending_results:
+                return True
+            results, self._pending_results = self._pending_results, []
+            try:
+                # 游戏记录与统计更新在同一事务中完成
+                await asyncio.to_thread(self.db_manager.save_game_results, results)
+                return True
+            except Exception as e:
+                self.logger.error(f"保存游戏结果失败，稍后重试: {e}")
+                self._pending_results[:0] = results
+                return False
+
+    def _get_result_write_lock(self) -> asyncio.Lock:
+        """获取当前事件循环的结果写入锁（事件循环变化时重新创建）"""
+        loop = asyncio.get_running_loop()
+        if self._result_write_lock is None or self._result_write_lock_loop is not loop:
+            self._result_write_lock = asyncio.Lock()
+            self._result_write_lock_loop = loop
+        return self._result_write_lock
+
+    def _ensure_task(self, attr: str, coro_factory):
+        """确保attr保存的后台任务在当前事件循环中运行
+
+        任务不存在、已完成或属于已停止的旧事件循环时，用coro_factory()创建新任务
+        """
+        task = getattr(self, attr)
+        loop = asyncio.get_running_loop()
+        if task is None or task.done() or task.get_loop() is not loop:
+            setattr(self, attr, loop.create_task(coro_factory()))
+
+    async def _expire_waiting_players(self):
+        """睡眠到最早的等待超时时间，移除超时的等待玩家，没有等待的玩家时退出"""
+        while True:
+            expires_at = self.game_manager.next_waiting_expiry()
+            if expires_at is None:
+                return
+            await asyncio.sleep(max(0.0, expires_at - time.monotonic()))
+            self.game_manager.cleanup_expired_waiting_players()
+
+    async def _expire_timeout_games(self):
+        """睡眠到最早的对局超时时间，清理超时的对局，超时检查堆为空时退出"""
+        while True:
+            timeout_at = self.game_manager.next_game_timeout(_GAME_TIMEOUT_MINUTES)
+            if timeout_at is None:
+                return
+            await asyncio.sleep(max(0.0, timeout_at - time.monotonic()))
+            timeout_games = self.game_manager.cleanup_timeout_games(_GAME_TIMEOUT_MINUTES)
+            if timeout_games:
+                self.logger.info(f"已清理 {len(timeout_games)} 个超时的对局")
+
+    async def _pvp_action(self, user_id: str, group_id: str, game_type: str, action: str) -> MessageBuilder:
+        """发起(start)或加入(join)对战"""
+        game_name = _GAME_NAMES[game_type]
+        prefix = _GAME_PREFIXES[game_type]
         try:
-            # 保存游戏记录
-            self.db_manager.save_game_record(
-                game_type=session.game_type,
-                player1_id=session.player1_id,
-                player2_id=session.player2_id,
-                group_id=session.group_id,
-                winner_id=winner_id,
-                moves_count=session.moves_count,
-                game_data=game_data,
-                is_ai_game=session.is_ai_game
-            )
-
-            # 更新用户统计（只对真实玩家）
-            if not session.is_ai_game:
-                # 更新玩家1统计
-                if winner_id == session.player1_id:
-                    result1 = 'win'
-                elif winner_id is None:
-                    result1 = 'draw'
-                else:
-                    result1 = 'loss'
-
-                self.db_manager.update_user_stats(session.player1_id, session.group_id, session.game_type, result1)
-
-                # 更新玩家2统计
-                if winner_id == session.player2_id:
-                    result2 = 'win'
-                elif winner_id is None:
-                    result2 = 'draw'
-                else:
-                    result2 = 'loss'
-
-                self.db_manager.update_user_stats(session.player2_id, session.group_id, session.game_type, result2)
-            else:
-                # AI游戏只更新真实玩家统计
-                if winner_id == session.player1_id:
-                    result = 'win'
-                elif winner_id is None:
-                    result = 'draw'
-                else:
-                    result = 'loss'
-
-                self.db_manager.update_user_stats(session.player1_id, session.group_id, session.game_type, result)
+            # 一次获取当前游戏和等待状态（先清理超时的等待玩家）
+            status = self.game_manager.get_user_status(user_id, group_id, cleanup_type=game_type)
 
-        except Exception as e:
-            self.logger.error(f"保存游戏结果失败: {e}")
-
-    async def _start_tictactoe_pvp(self, user_id: str, group_id: str) -> MessageBuilder:
-        """发起井字棋对战"""
-        try:
             # 1. 检查用户是否已经在游戏中
-            current_game = self.game_manager.get_user_game(user_id, group_id)
+            current_game = status['current_game']
             if current_game:
-                game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
+                game_type_name = _GAME_NAMES[current_game.game_type]
                 return MessageBuilder.text(f"\n❌ 您正在进行{game_type_name}游戏，请先完成或认输")
 
             # 2. 检查用户是否已经在等待队列中
-            current_waiting_players = self.game_manager.get_waiting_players(group_id, 'tictactoe')
-            if user_id in current_waiting_players:
-                waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'tictactoe') or 0
-                remaining_time = max(0, 60 - waiting_time)
-                if remaining_time > 0:
-                    return MessageBuilder.text(f"""
-⏳ 您已经在井字棋等待队列中
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {waiting_time // 60}分{waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒
-
-💡 请耐心等待其他玩家加入
-🏳️ 发送 认输 可以取消等待""")
-
-            # 3. 尝试匹配对手
-            opponent_id = self.game_manager.add_waiting_player(user_id, group_id, 'tictactoe')
-
-            if opponent_id:
-                # 找到对手，开始游戏
-                return await self._create_tictactoe_pvp_game(user_id, opponent_id, group_id)
-            else:
+            # （超时的等待玩家已被清理，队列中的玩家一定还在等待时间内）
+            waiting_time = status['waiting_times'].get(game_type)
+            if waiting_time is not None:
+                return MessageBuilder.text(_format_wait_status(
+                    f"您已经在{game_name}等待队列中", user_id, waiting_time, _ALREADY_WAITING_FOOTER))
+
+            # 3. 尝试匹配对手，没有对手时加入等待队列
+            outcome, opponent_id = self.game_manager.try_match_or_enqueue(user_id, group_id, game_type)
+
+            if outcome == 'matched':
+                # 找到对手，开始游戏（发起者执先手，加入时等待中的对手执先手）
+                create_game = self._pvp_game_creators[game_type]
+                if action == 'start':
+                    return await create_game(user_id, opponent_id, group_id)
+                return await create_game(opponent_id, user_id, group_id)
+            if outcome == 'enqueued':
+                # 进入等待队列，由后台任务在超时后移出
+                self._ensure_task('_waiting_expiry_task', self._expire_waiting_players)
+
+            if action == 'start':
                 # 没有对手，进入等待状态
-                return MessageBuilder.text(f"""
-🎮 井字棋对战房间已创建！
-
-👤 发起者: 用户{user_id}
-⏳ 等待对手加入...
-⏰ 等待时间: 1分钟（超时自动取消）
-
-💡 其他玩家发送 # 加入 来加入对战
-🏳️ 发送 认输 可以取消等待""")
-
-        except Exception as e:
-            self.logger.error(f"发起井字棋对战失败: {e}")
-            return MessageBuilder.text("\n❌ 发起对战失败，请稍后重试")
-
-    async def _join_tictactoe_pvp(self, user_id: str, group_id: str) -> MessageBuilder:
-        """加入井字棋对战"""
-        try:
-            # 1. 检查用户是否已经在游戏中
-            current_game = self.game_manager.get_user_game(user_id, group_id)
-            if current_game:
-                game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
-                return MessageBuilder.text(f"\n❌ 您正在进行{game_type_name}游戏，请先完成或认输")
-
-            # 2. 检查用户是否已经在等待队列中
-            current_waiting_players = self.game_manager.get_waiting_players(group_id, 'tictactoe')
-            if user_id in current_waiting_players:
-                waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'tictactoe') or 0
-                remaining_time = max(0, 60 - waiting_time)
-                if remaining_time > 0:
-                    return MessageBuilder.text(f"""
-⏳ 您已经在井字棋等待队列中
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {waiting_time // 60}分{waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒
-
-💡 请耐心等待其他玩家加入
-🏳️ 发送 认输 可以取消等待""")
-                else:
-                    # 等待已超时，从队列中移除
-                    self.game_manager.remove_waiting_player(user_id, group_id, 'tictactoe')
-                    return MessageBuilder.text(f"""
-⏰ 您的等待已超时，已自动退出队列
-
-💡 请重新发送 # 对战 创建新的对战房间
-💡 或等待其他玩家创建房间后发送 # 加入""")
-
-            # 3. 尝试匹配对手
-            opponent_id = self.game_manager.add_waiting_player(user_id, group_id, 'tictactoe')
-
-            if opponent_id:
-                # 找到对手，开始游戏
-                return await self._create_tictactoe_pvp_game(opponent_id, user_id, group_id)
+                return MessageBuilder.text(_ROOM_CREATED_TEMPLATE.format(
+                    game_name=game_name, user_id=user_id, prefix=prefix))
+            elif outcome == 'enqueued':
+                # 没有等待的对手，已为用户创建房间
+                return MessageBuilder.text(_ROOM_AUTO_CREATED_TEMPLATE.format(user_id=user_id, prefix=prefix))
             else:
-                # 没有等待的对手，检查是否成功加入队列
-                updated_waiting_players = self.game_manager.get_waiting_players(group_id, 'tictactoe')
-                if user_id in updated_waiting_players:
-                    return MessageBuilder.text(f"""
-🎮 没有等待中的对战房间，已为您创建新房间！
-
-👤 房间创建者: 用户{user_id}
-⏳ 等待其他玩家加入...
-⏰ 等待时间: 1分钟（超时自动取消）
-
-💡 其他玩家发送 # 加入 即可开始对战
-🏳️ 发送 认输 可以取消等待""")
-                else:
-                    # 这种情况理论上不应该发生，但作为保险
-                    return MessageBuilder.text(f"""
-❌ 加入对战失败
-
-💡 请发送 # 对战 创建对战房间""")
+                # 这种情况理论上不应该发生（已在第2步处理），但作为保险
+                return MessageBuilder.text(_JOIN_FAILED_TEMPLATE.format(prefix=prefix))
 
         except Exception as e:
-            self.logger.error(f"加入井字棋对战失败: {e}")
-            return MessageBuilder.text("\n❌ 加入对战失败，请稍后重试")
+            action_name = '发起' if action == 'start' else '加入'
+            self.logger.error(f"{action_name}{game_name}对战失败: {e}")
+            return MessageBuilder.text(f"\n❌ {action_name}对战失败，请稍后重试")
 
     async def _create_tictactoe_pvp_game(self, player1_id: str, player2_id: str, group_id: str) -> MessageBuilder:
         """创建井字棋PvP游戏"""
         try:
-            from ..games.tictactoe import TicTacToe
-
             # 创建游戏会话
             session = self.game_manager.create_game(
                 game_type='tictactoe',
@@ -919,6 +1034,7 @@ class CommandHandler:
                 group_id=group_id,
                 bot_id=0
             )
+            self._ensure_task('_game_timeout_task', self._expire_timeout_games)
 
             # 创建游戏实例
             game = TicTacToe(player1_id, player2_id)
@@ -932,154 +1048,26 @@ class CommandHandler:
                 image_data = await self.render_system.render_to_image('tictactoe_board.html', html_data, width=600)
 
                 if image_data:
-                    caption = f"\n🎮 井字棋对战开始！\n👥 X: 用户{player1_id} \n O: 用户{player2_id}\n💡 轮到 X 下棋，使用 # <位置> 命令"
+                    caption = _TTT_PVP_CAPTION.format(player1_id=player1_id, player2_id=player2_id)
                     return MessageBuilder.image(base64_data=image_data, caption=caption)
                 else:
                     # 图片生成失败，返回文本
-                    return MessageBuilder.text(f"""
-🎮 井字棋对战开始！
-
-👥 玩家：
-• X (先手): 用户{player1_id}
-• O (后手): 用户{player2_id}
-
-{game.get_board_display()}
-
-💡 轮到 X 下棋，使用 # <位置> 命令""")
+                    return MessageBuilder.text(_TTT_PVP_START_TEMPLATE.format(
+                        player1_id=player1_id, player2_id=player2_id, board=game.get_board_display()))
 
             except Exception as render_error:
                 self.logger.error(f"渲染井字棋棋盘失败: {render_error}")
                 # 渲染失败，返回文本
-                return MessageBuilder.text(f"""
-🎮 井字棋对战开始！
-
-👥 玩家：
-• X (先手): 用户{player1_id}
-• O (后手): 用户{player2_id}
-
-{game.get_board_display()}
-
-💡 轮到 X 下棋，使用 # <位置> 命令""")
+                return MessageBuilder.text(_TTT_PVP_START_TEMPLATE.format(
+                    player1_id=player1_id, player2_id=player2_id, board=game.get_board_display()))
 
         except Exception as e:
             self.logger.error(f"创建井字棋PvP游戏失败: {e}")
             return MessageBuilder.text("\n❌ 创建游戏失败，请稍后重试")
 
-    async def _start_gomoku_pvp(self, user_id: str, group_id: str) -> MessageBuilder:
-        """发起五子棋对战"""
-        try:
-            # 1. 检查用户是否已经在游戏中
-            current_game = self.game_manager.get_user_game(user_id, group_id)
-            if current_game:
-                game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
-                return MessageBuilder.text(f"\n❌ 您正在进行{game_type_name}游戏，请先完成或认输")
-
-            # 2. 检查用户是否已经在等待队列中
-            current_waiting_players = self.game_manager.get_waiting_players(group_id, 'gomoku')
-            if user_id in current_waiting_players:
-                waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'gomoku') or 0
-                remaining_time = max(0, 60 - waiting_time)
-                if remaining_time > 0:
-                    return MessageBuilder.text(f"""
-⏳ 您已经在五子棋等待队列中
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {waiting_time // 60}分{waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒
-
-💡 请耐心等待其他玩家加入
-🏳️ 发送 认输 可以取消等待""")
-
-            # 3. 尝试匹配对手
-            opponent_id = self.game_manager.add_waiting_player(user_id, group_id, 'gomoku')
-
-            if opponent_id:
-                # 找到对手，开始游戏
-                return await self._create_gomoku_pvp_game(user_id, opponent_id, group_id)
-            else:
-                # 没有对手，进入等待状态
-                return MessageBuilder.text(f"""
-🎮 五子棋对战房间已创建！
-
-👤 发起者: 用户{user_id}
-⏳ 等待对手加入...
-⏰ 等待时间: 1分钟（超时自动取消）
-
-💡 其他玩家发送 f 加入 来加入对战
-🏳️ 发送 认输 可以取消等待""")
-
-        except Exception as e:
-            self.logger.error(f"发起五子棋对战失败: {e}")
-            return MessageBuilder.text("\n❌ 发起对战失败，请稍后重试")
-
-    async def _join_gomoku_pvp(self, user_id: str, group_id: str) -> MessageBuilder:
-        """加入五子棋对战"""
-        try:
-            # 1. 检查用户是否已经在游戏中
-            current_game = self.game_manager.get_user_game(user_id, group_id)
-            if current_game:
-                game_type_name = "井字棋" if current_game.game_type == "tictactoe" else "五子棋"
-                return MessageBuilder.text(f"\n❌ 您正在进行{game_type_name}游戏，请先完成或认输")
-
-            # 2. 检查用户是否已经在等待队列中
-            current_waiting_players = self.game_manager.get_waiting_players(group_id, 'gomoku')
-            if user_id in current_waiting_players:
-                waiting_time = self.game_manager.get_waiting_time(user_id, group_id, 'gomoku') or 0
-                remaining_time = max(0, 60 - waiting_time)
-                if remaining_time > 0:
-                    return MessageBuilder.text(f"""
-⏳ 您已经在五子棋等待队列中
-
-👤 等待玩家: 用户{user_id}
-⏰ 已等待: {waiting_time // 60}分{waiting_time % 60}秒
-⏰ 剩余时间: {remaining_time // 60}分{remaining_time % 60}秒
-
-💡 请耐心等待其他玩家加入
-🏳️ 发送 认输 可以取消等待""")
-                else:
-                    # 等待已超时，从队列中移除
-                    self.game_manager.remove_waiting_player(user_id, group_id, 'gomoku')
-                    return MessageBuilder.text(f"""
-⏰ 您的等待已超时，已自动退出队列
-
-💡 请重新发送 f 对战 创建新的对战房间
-💡 或等待其他玩家创建房间后发送 f 加入""")
-
-            # 3. 尝试匹配对手
-            opponent_id = self.game_manager.add_waiting_player(user_id, group_id, 'gomoku')
-
-            if opponent_id:
-                # 找到对手，开始游戏
-                return await self._create_gomoku_pvp_game(opponent_id, user_id, group_id)
-            else:
-                # 没有等待的对手，检查是否成功加入队列
-                updated_waiting_players = self.game_manager.get_waiting_players(group_id, 'gomoku')
-                if user_id in updated_waiting_players:
-                    return MessageBuilder.text(f"""
-🎮 没有等待中的对战房间，已为您创建新房间！
-
-👤 房间创建者: 用户{user_id}
-⏳ 等待其他玩家加入...
-⏰ 等待时间: 1分钟（超时自动取消）
-
-💡 其他玩家发送 f 加入 即可开始对战
-🏳️ 发送 认输 可以取消等待""")
-                else:
-                    # 这种情况理论上不应该发生，但作为保险
-                    return MessageBuilder.text(f"""
-❌ 加入对战失败
-
-💡 请发送 f 对战 创建对战房间""")
-
-        except Exception as e:
-            self.logger.error(f"加入五子棋对战失败: {e}")
-            return MessageBuilder.text("\n❌ 加入对战失败，请稍后重试")
-
     async def _create_gomoku_pvp_game(self, player1_id: str, player2_id: str, group_id: str) -> MessageBuilder:
         """创建五子棋PvP游戏"""
         try:
-            from ..games.gomoku import Gomoku
-
             # 创建游戏会话
             session = self.game_manager.create_game(
                 game_type='gomoku',
@@ -1088,6 +1076,7 @@ class CommandHandler:
                 group_id=group_id,
                 bot_id=0
             )
+            self._ensure_task('_game_timeout_task', self._expire_timeout_games)
 
             # 创建游戏实例
             game = Gomoku(player1_id, player2_id)
@@ -1101,30 +1090,18 @@ class CommandHandler:
                 image_data = await self.render_system.render_to_image('gomoku_board.html', html_data, width=700)
 
                 if image_data:
-                    caption = f"\n🎮 五子棋对战开始！\n{player1_id} (●) vs {player2_id} (○)\n轮到 {player1_id} 下棋"
+                    caption = _GOMOKU_PVP_CAPTION.format(player1_id=player1_id, player2_id=player2_id)
                     return MessageBuilder.image(base64_data=image_data, caption=caption)
                 else:
                     # 图片生成失败，使用文本
-                    return MessageBuilder.text(f"""
-🎮 五子棋对战开始！
-
-● 黑棋: 用户{player1_id}
-○ 白棋: 用户{player2_id}
-
-轮到 用户{player1_id} 下棋
-请发送坐标，如：f H8""")
+                    return MessageBuilder.text(_GOMOKU_PVP_START_TEMPLATE.format(
+                        player1_id=player1_id, player2_id=player2_id))
 
             except Exception as e:
                 self.logger.error(f"生成五子棋对战棋盘图片失败: {e}")
                 # 回退到文本显示
-                return MessageBuilder.text(f"""
-🎮 五子棋对战开始！
-
-● 黑棋: 用户{player1_id}
-○ 白棋: 用户{player2_id}
-
-轮到 用户{player1_id} 下棋
-请发送坐标，如：f H8""")
+                return MessageBuilder.text(_GOMOKU_PVP_START_TEMPLATE.format(
+                    player1_id=player1_id, player2_id=player2_id))
 
         except Exception as e:
             self.logger.error(f"创建五子棋PvP游戏失败: {e}")
@@ -1139,18 +1116,16 @@ class CommandHandler:
 
             # 解析难度（支持中文和英文）
             difficulty_input = args[0] if args else 'medium'
-            difficulty_map = {
-                '简单': 'easy', 'easy': 'easy',
-                '中等': 'medium', 'medium': 'medium',
-                '困难': 'hard', 'hard': 'hard'
-            }
-            difficulty = difficulty_map.get(difficulty_input.lower(), difficulty_input.lower())
+            difficulty_input = difficulty_input.lower()
+            difficulty = _DIFFICULTY_MAP.get(difficulty_input, difficulty_input)
 
-            if difficulty not in self.ai_system.get_available_difficulties():
+            if difficulty not in self._valid_difficulties:
                 return MessageBuilder.text("❌ 无效的难度级别，请选择：简单(easy)、中等(medium)、困难(hard)")
 
             # 创建游戏会话
             session = self.game_manager.create_game('tictactoe', user_id, 'AI', group_id, 1)
+            self._ensure_task('_game_timeout_task', self._expire_timeout_games)
+            session.ai_difficulty = difficulty
 
             # 创建游戏实例
             game = TicTacToe(user_id, 'AI')
@@ -1166,37 +1141,21 @@ class CommandHandler:
                 if image_data:
                     # 简要文字说明
                     difficulty_desc = self.ai_system.get_difficulty_description(difficulty)
-                    caption = f"\n🎮 井字棋 vs AI 开始！\n👥 X: 您 \n O: AI ({difficulty_desc})\n💡 轮到您下棋，使用 # <位置> 命令"
+                    caption = _TTT_AI_CAPTION.format(difficulty_desc=difficulty_desc)
                     return MessageBuilder.image(base64_data=image_data, caption=caption)
                 else:
                     # 图片生成失败，使用文本
                     difficulty_desc = self.ai_system.get_difficulty_description(difficulty)
-                    start_text = f"""
-\n🎮 井字棋 vs AI 开始！
-
-👥 玩家：
-• X (先手): 您
-• O (后手): AI ({difficulty_desc})
-
-{game.get_board_display()}
-
-💡 提示：轮到您下棋，使用 # <位置> 命令下棋"""
+                    start_text = _TTT_AI_START_TEMPLATE.format(
+                        difficulty_desc=difficulty_desc, board=game.get_board_display())
                     return MessageBuilder.text(start_text)
 
             except Exception as e:
                 self.logger.error(f"井字棋AI棋盘图片生成失败: {e}")
                 # 回退到文本显示
                 difficulty_desc = self.ai_system.get_difficulty_description(difficulty)
-                start_text = f"""
-\n🎮 井字棋 vs AI 开始！
-
-👥 玩家：
-• X (先手): 您
-• O (后手): AI ({difficulty_desc})
-
-{game.get_board_display()}
-
-💡 提示：轮到您下棋，使用 # <位置> 命令下棋"""
+                start_text = _TTT_AI_START_TEMPLATE.format(
+                    difficulty_desc=difficulty_desc, board=game.get_board_display())
                 return MessageBuilder.text(start_text)
 
         except Exception as e:
@@ -1226,115 +1185,72 @@ class CommandHandler:
 
             # 执行移动
             result = game.make_move(user_id, position)
-            session.moves_count = game.moves_count
 
-            if result.result.value == 'invalid':
+            # 棋盘没有变化（无效移动）时不重新渲染，也不刷新最后落子时间
+            if not result.board_changed:
                 return MessageBuilder.text(f"{result.message}")
+            session.record_move(game.moves_count)
+
+            # AI游戏且轮到AI时，先让AI落子，两张棋盘图片并发渲染
+            html_data = game.get_html_data()
+            # 添加机器人APP ID用于头像显示
+            html_data['bot_app_id'] = self._get_bot_app_id()
+            board_text = None
+            ai_move = ai_result = None
+            game_over = result.result.value in _GAME_OVER_RESULTS
+            if not game_over and session.is_ai_game and game.current_player == 'AI':
+                ai_move = self.ai_system.get_ai_move(game, session.ai_difficulty)
+                if ai_move:
+                    # 文字回退需要玩家落子后的棋盘，在AI落子前生成
+                    board_text = game.get_board_display()
+                    ai_result = game.make_move('AI', ai_move)
+                    session.record_move(game.moves_count)
 
             # 生成棋盘图片
-            try:
-                html_data = game.get_html_data()
-                # 添加机器人APP ID用于头像显示
-                html_data['bot_app_id'] = self._get_bot_app_id()
-                image_data = await self.render_system.render_to_image('tictactoe_board.html', html_data, width=600)
-
-                if image_data:
-                    caption = f"\n🎮 井字棋\n{result.message}"
-
-                    # 检查游戏是否结束
-                    if result.result.value in ['win', 'draw']:
-                        # 保存游戏结果
-                        game_data = json.dumps(game.to_dict())
-                        await self._save_game_result(session, result.winner, game_data)
-
-                        # 移除游戏
-                        self.game_manager.remove_game(session.game_id)
-
-                        # 游戏结束，直接返回
-                        return MessageBuilder.image(base64_data=image_data, caption=caption)
-
-                    # 游戏未结束，先保存玩家移动的图片，稍后可能需要回复两条消息
-                    player_move_image = MessageBuilder.image(base64_data=image_data, caption=caption)
-                else:
-                    # 图片生成失败，使用文本
-                    response_text = f"{game.get_board_display()}\n\n{result.message}"
-
-                    # 检查游戏是否结束
-                    if result.result.value in ['win', 'draw']:
-                        # 保存游戏结果
-                        game_data = json.dumps(game.to_dict())
-                        await self._save_game_result(session, result.winner, game_data)
-
-                        # 移除游戏
-                        self.game_manager.remove_game(session.game_id)
-
-                        # 游戏结束，直接返回
-                        return MessageBuilder.text(response_text)
-
-                    # 游戏未结束，先保存玩家移动的文本，稍后可能需要回复两条消息
-                    player_move_image = MessageBuilder.text(response_text)
-
-            except Exception as e:
-                self.logger.error(f"井字棋移动后图片生成失败: {e}")
-                # 回退到文本显示
-                response_text = f"{game.get_board_display()}\n\n{result.message}"
-
-                # 检查游戏是否结束
-                if result.result.value in ['win', 'draw']:
-                    # 保存游戏结果
-                    game_data = json.dumps(game.to_dict())
-                    await self._save_game_result(session, result.winner, game_data)
-
-                    # 移除游戏
-                    self.game_manager.remove_game(session.game_id)
-
-                    # 游戏结束，直接返回
-                    return MessageBuilder.text(response_text)
-
-                # 游戏未结束，先保存玩家移动的文本，稍后可能需要回复两条消息
-                player_move_image = MessageBuilder.text(response_text)
+            renders = [self.render_system.render_to_image('tictactoe_board.html', html_data, width=600)]
+            if ai_result is not None:
+                html_data_ai = game.get_html_data()
+                renders.append(self.render_system.render_to_image('tictactoe_board.html', html_data_ai, width=600))
+            images = await asyncio.gather(*renders, return_exceptions=True)
+
+            # 第一条消息：玩家移动结果
+            image_data = images[0]
+            if isinstance(image_data, Exception):
+                self.logger.error(f"井字棋移动后图片生成失败: {image_data}")
+                image_data = None
+            if image_data:
+                player_message = MessageBuilder.image(base64_data=image_data, caption=f"\n🎮 井字棋\n{result.message}")
+            else:
+                # 图片生成失败，使用文本
+                if board_text is None:
+                    board_text = game.get_board_display()
+                player_message = MessageBuilder.text(f"{board_text}\n\n{result.message}")
+
+            # 检查游戏是否结束
+            if game_over:
+                # 保存游戏结果并移除游戏，直接返回
+                await self._finalize_game(session, result.winner)
+                return player_message
+
+            if ai_result is None:
+                # 不是AI游戏或不轮到AI，返回玩家移动的单条消息
+                return player_message
 
-            # 如果是AI游戏且轮到AI，返回两条消息
-            if session.is_ai_game and game.current_player == 'AI':
-                # 第一条消息：使用之前保存的玩家移动结果
-                first_message = player_move_image
+            # 第二条消息：AI移动结果
+            ai_image_data = images[1]
+            if ai_image_data and not isinstance(ai_image_data, Exception):
+                ai_message = MessageBuilder.image(base64_data=ai_image_data,
+                                                  caption=f"\n🎮 井字棋 \n AI选择了位置 {ai_move}\n{ai_result.message}")
+            else:
+                ai_message = MessageBuilder.text(
+                    f"{game.get_board_display()}\n\nAI选择了位置 {ai_move}\n{ai_result.message}")
 
-                # AI下棋
-                ai_move = self.ai_system.get_ai_move(game, 'medium')
+            # 检查AI移动后游戏是否结束
+            if ai_result.result.value in _GAME_OVER_RESULTS:
+                await self._finalize_game(session, ai_result.winner)
 
-                if ai_move:
-                    ai_result = game.make_move('AI', ai_move)
-                    session.moves_count = game.moves_count
-
-                    # 准备第二条消息：AI移动结果
-                    try:
-                        html_data_ai = game.get_html_data()
-                        ai_image_data = await self.render_system.render_to_image('tictactoe_board.html', html_data_ai,
-                                                                                 width=600)
-
-                        if ai_image_data:
-                            second_message = MessageBuilder.image(base64_data=ai_image_data,
-                                                                  caption=f"\n🎮 井字棋 \n AI选择了位置 {ai_move}\n{ai_result.message}")
-                        else:
-                            second_message = MessageBuilder.text(
-                                f"{game.get_board_display()}\n\nAI选择了位置 {ai_move}\n{ai_result.message}")
-                    except Exception as e:
-                        second_message = MessageBuilder.text(
-                            f"{game.get_board_display()}\n\nAI选择了位置 {ai_move}\n{ai_result.message}")
-
-                    # 检查AI移动后游戏是否结束
-                    if ai_result.result.value in ['win', 'draw']:
-                        game_data = json.dumps(game.to_dict())
-                        await self._save_game_result(session, ai_result.winner, game_data)
-                        self.game_manager.remove_game(session.game_id)
-
-                    # 返回两条消息
-                    return [first_message, second_message]
-                else:
-                    pass
-            else:
-                # 不是AI游戏或不轮到AI，返回玩家移动的单条消息
-                return player_move_image
+            # 返回两条消息
+            return [player_message, ai_message]
 
         except Exception as e:
             self.logger.error(f"执行井字棋移动失败: {e}")
@@ -1349,18 +1265,16 @@ class CommandHandler:
 
             # 解析难度（支持中文和英文）
             difficulty_input = args[0] if args else 'medium'
-            difficulty_map = {
-                '简单': 'easy', 'easy': 'easy',
-                '中等': 'medium', 'medium': 'medium',
-                '困难': 'hard', 'hard': 'hard'
-            }
-            difficulty = difficulty_map.get(difficulty_input.lower(), difficulty_input.lower())
+            difficulty_input = difficulty_input.lower()
+            difficulty = _DIFFICULTY_MAP.get(difficulty_input, difficulty_input)
 
-            if difficulty not in self.ai_system.get_available_difficulties():
+            if difficulty not in self._valid_difficulties:
                 return MessageBuilder.text("❌ 无效的难度级别，请选择：简单(easy)、中等(medium)、困难(hard)")
 
             # 创建游戏会话
             session = self.game_manager.create_game('gomoku', user_id, 'AI', group_id, 1)
+            self._ensure_task('_game_timeout_task', self._expire_timeout_games)
+            session.ai_difficulty = difficulty
 
             # 创建游戏实例
             game = Gomoku(user_id, 'AI')
@@ -1377,37 +1291,21 @@ class CommandHandler:
                 if image_data:
                     # 简要文字说明
                     difficulty_desc = self.ai_system.get_difficulty_description(difficulty)
-                    caption = f"\n🎮 五子棋 vs AI 开始！\n👥 ●: 您 \n ○: AI ({difficulty_desc})\n💡 轮到您下棋，使用 f <坐标> 命令"
+                    caption = _GOMOKU_AI_CAPTION.format(difficulty_desc=difficulty_desc)
                     return MessageBuilder.image(base64_data=image_data, caption=caption)
                 else:
                     # 图片生成失败，使用文本
                     difficulty_desc = self.ai_system.get_difficulty_description(difficulty)
-                    start_text = f"""
-🎮 五子棋 vs AI 开始！
-
-👥 玩家：
-• ● (黑棋先手): 您
-• ○ (白棋后手): AI ({difficulty_desc})
-
-{game.get_board_display()}
-
-💡 提示：轮到您下棋，使用 f <坐标> 命令下棋（如：f H8）"""
+                    start_text = _GOMOKU_AI_START_TEMPLATE.format(
+                        difficulty_desc=difficulty_desc, board=game.get_board_display())
                     return MessageBuilder.text(start_text)
 
             except Exception as e:
                 self.logger.error(f"五子棋AI棋盘图片生成失败: {e}")
                 # 回退到文本显示
                 difficulty_desc = self.ai_system.get_difficulty_description(difficulty)
-                start_text = f"""
-🎮 五子棋 vs AI 开始！
-
-👥 玩家：
-• ● (黑棋先手): 您
-• ○ (白棋后手): AI ({difficulty_desc})
-
-{game.get_board_display()}
-
-💡 提示：轮到您下棋，使用 f <坐标> 命令下棋（如：f H8）"""
+                start_text = _GOMOKU_AI_START_TEMPLATE.format(
+                    difficulty_desc=difficulty_desc, board=game.get_board_display())
                 return MessageBuilder.text(start_text)
 
         except Exception as e:
@@ -1434,118 +1332,73 @@ class CommandHandler:
 
             # 执行移动
             result = game.make_move(user_id, position)
-            session.moves_count = game.moves_count
 
-            if result.result.value == 'invalid':
+            # 棋盘没有变化（无效移动）时不重新渲染，也不刷新最后落子时间
+            if not result.board_changed:
                 return MessageBuilder.text(f"❌ {result.message}")
+            session.record_move(game.moves_count)
+
+            # AI游戏且轮到AI时，先让AI落子，两张棋盘图片并发渲染
+            html_data = game.get_html_data()
+            # 添加机器人APP ID用于头像显示
+            html_data['bot_app_id'] = self._get_bot_app_id()
+            board_text = None
+            ai_move = ai_result = None
+            game_over = result.result.value in _GAME_OVER_RESULTS
+            if not game_over and session.is_ai_game and game.current_player == 'AI':
+                ai_move = self.ai_system.get_ai_move(game, session.ai_difficulty)
+                if ai_move:
+                    # 棋盘列表会被AI落子原地修改，玩家落子后的棋盘需要复制一份；文字回退的棋盘也在AI落子前生成
+                    html_data['board'] = [row[:] for row in html_data['board']]
+                    board_text = game.get_board_display()
+                    ai_result = game.make_move('AI', ai_move)
+                    session.record_move(game.moves_count)
 
             # 生成棋盘图片
-            try:
-                html_data = game.get_html_data()
-                # 添加机器人APP ID用于头像显示
-                html_data['bot_app_id'] = self._get_bot_app_id()
-
-                image_data = await self.render_system.render_to_image('gomoku_board.html', html_data, width=800)
-
-                if image_data:
-                    caption = f"🎮 五子棋 - {result.message}"
-
-                    # 检查游戏是否结束
-                    if result.result.value in ['win', 'draw']:
-                        # 保存游戏结果
-                        game_data = json.dumps(game.to_dict())
-                        await self._save_game_result(session, result.winner, game_data)
-
-                        # 移除游戏
-                        self.game_manager.remove_game(session.game_id)
-
-                        # 游戏结束，直接返回
-                        return MessageBuilder.image(base64_data=image_data, caption=caption)
-
-                    # 游戏未结束，先保存玩家移动的图片，稍后可能需要发送两条消息
-                    player_move_image = MessageBuilder.image(base64_data=image_data, caption=caption)
-                else:
-                    # 图片生成失败，使用文本
-                    response_text = f"{game.get_board_display()}\n\n{result.message}"
-
-                    # 检查游戏是否结束
-                    if result.result.value in ['win', 'draw']:
-                        # 保存游戏结果
-                        game_data = json.dumps(game.to_dict())
-                        await self._save_game_result(session, result.winner, game_data)
-
-                        # 移除游戏
-                        self.game_manager.remove_game(session.game_id)
-
-                        # 游戏结束，直接返回
-                        return MessageBuilder.text(response_text)
-
-                    # 游戏未结束，先保存玩家移动的文本，稍后可能需要发送两条消息
-                    player_move_image = MessageBuilder.text(response_text)
-
-            except Exception as e:
-                self.logger.error(f"五子棋移动后图片生成失败: {e}")
-                # 回退到文本显示
-                response_text = f"{game.get_board_display()}\n\n{result.message}"
-
-                # 检查游戏是否结束
-                if result.result.value in ['win', 'draw']:
-                    # 保存游戏结果
-                    game_data = json.dumps(game.to_dict())
-                    await self._save_game_result(session, result.winner, game_data)
-
-                    # 移除游戏
-                    self.game_manager.remove_game(session.game_id)
-
-                    # 游戏结束，直接返回
-                    return MessageBuilder.text(response_text)
-
-                # 游戏未结束，先保存玩家移动的文本，稍后可能需要发送两条消息
-                player_move_image = MessageBuilder.text(response_text)
-
-            # 检查是否是AI游戏且轮到AI
-            # 如果是AI游戏且轮到AI，返回两条消息
-            if session.is_ai_game and game.current_player == 'AI':
+            renders = [self.render_system.render_to_image('gomoku_board.html', html_data, width=800)]
+            if ai_result is not None:
+                html_data_ai = game.get_html_data()
+                renders.append(self.render_system.render_to_image('gomoku_board.html', html_data_ai, width=800))
+            images = await asyncio.gather(*renders, return_exceptions=True)
+
+            # 第一条消息：玩家移动结果
+            image_data = images[0]
+            if isinstance(image_data, Exception):
+                self.logger.error(f"五子棋移动后图片生成失败: {image_data}")
+                image_data = None
+            if image_data:
+                player_message = MessageBuilder.image(base64_data=image_data, caption=f"🎮 五子棋 - {result.message}")
+            else:
+                # 图片生成失败，使用文本
+                if board_text is None:
+                    board_text = game.get_board_display()
+                player_message = MessageBuilder.text(f"{board_text}\n\n{result.message}")
+
+            # 检查游戏是否结束
+            if game_over:
+                # 保存游戏结果并移除游戏，直接返回
+                await self._finalize_game(session, result.winner)
+                return player_message
+
+            if ai_result is None:
+                # 不是AI游戏或不轮到AI，返回玩家移动的单条消息
+                return player_message
 
-                # 第一条消息：使用之前保存的玩家移动结果
-                first_message = player_move_image
+            # 第二条消息：AI移动结果
+            ai_image_data = images[1]
+            if ai_image_data and not isinstance(ai_image_data, Exception):
+                ai_message = MessageBuilder.image(base64_data=ai_image_data,
+                                                  caption=f"🎮 五子棋 - AI选择了位置 {ai_move}\n{ai_result.message}")
+            else:
+                ai_message = MessageBuilder.text(
+                    f"{game.get_board_display()}\n\nAI选择了位置 {ai_move}\n{ai_result.message}")
 
-                # AI下棋
-                ai_move = self.ai_system.get_ai_move(game, 'medium')
+            # 检查AI移动后游戏是否结束
+            if ai_result.result.value in _GAME_OVER_RESULTS:
+                await self._finalize_game(session, ai_result.winner)
 
-                if ai_move:
-                    ai_result = game.make_move('AI', ai_move)
-                    session.moves_count = game.moves_count
-
-                    # 准备第二条消息：AI移动结果
-                    try:
-                        html_data_ai = game.get_html_data()
-                        ai_image_data = await self.render_system.render_to_image('gomoku_board.html', html_data_ai,
-                                                                                 width=800)
-
-                        if ai_image_data:
-                            second_message = MessageBuilder.image(base64_data=ai_image_data,
-                                                                  caption=f"🎮 五子棋 - AI选择了位置 {ai_move}\n{ai_result.message}")
-                        else:
-                            second_message = MessageBuilder.text(
-                                f"{game.get_board_display()}\n\nAI选择了位置 {ai_move}\n{ai_result.message}")
-                    except Exception as e:
-                        second_message = MessageBuilder.text(
-                            f"{game.get_board_display()}\n\nAI选择了位置 {ai_move}\n{ai_result.message}")
-
-                    # 检查AI移动后游戏是否结束
-                    if ai_result.result.value in ['win', 'draw']:
-                        game_data = json.dumps(game.to_dict())
-                        await self._save_game_result(session, ai_result.winner, game_data)
-                        self.game_manager.remove_game(session.game_id)
-
-                    # 返回两条消息
-                    return [first_message, second_message]
-                else:
-                    pass
-            else:
-                # 不是AI游戏或不轮到AI，返回玩家移动的单条消息
-                return player_move_image
+            # 返回两条消息
+            return [player_message, ai_message]
 
         except Exception as e:
             self.logger.error(f"执行五子棋移动失败: {e}")
@@ -5,7 +5,9 @@ AI系统 - 提供不同难度的AI对手
 import random
 from typing import List, Tuple, Optional, Any
 
-from ..games.base_game import BaseGame
+from .bitboard import tictactoe_best_move, gomoku_masks_by_square, find_winning_square
+from .search import gomoku_best_move, TranspositionTable
+from ..games.base_game import BaseGame, GameResult
 from ..games.gomoku import Gomoku
 from ..games.tictactoe import TicTacToe
 
@@ -15,7 +17,8 @@ class AISystem:
 
     def __init__(self):
         """初始化AI系统"""
-        pass
+        # 五子棋搜索置换表（跨局复用，按代数老化）
+        self.transposition_table = TranspositionTable()
 
     def get_ai_move(self, game: BaseGame, difficulty: str = 'medium') -> Optional[Any]:
         """
@@ -54,7 +57,7 @@ class AISystem:
             for move in available_moves:
                 test_game = game.clone()
                 result = test_game.make_move(ai_player, move)
-                if result.result.value == 'win':
+                if result.result is GameResult.WIN:
                     return move
 
             # 检查是否需要阻止对手获胜
@@ -62,7 +65,7 @@ class AISystem:
                 test_game = game.clone()
                 test_game.current_player = opponent
                 result = test_game.make_move(opponent, move)
-                if result.result.value == 'win':
+                if result.result is GameResult.WIN:
                     return move
 
             # 优先选择中心和角落
@@ -75,7 +78,7 @@ class AISystem:
 
         elif difficulty == 'hard':
             # 困难难度：使用Minimax算法
-            return self._minimax_tictactoe(game, 'AI', 9)[1]
+            return self._minimax_tictactoe(game, 9)[1]
 
         return random.choice(available_moves)
 
@@ -114,66 +117,26 @@ class AISystem:
         row, col = random.choice(available_moves)
         return f"{chr(65 + col)}{row + 1}"
 
-    def _minimax_tictactoe(self, game: TicTacToe, player: str, depth: int) -> Tuple[int, Optional[int]]:
-        """井字棋Minimax算法"""
-        available_moves = game.get_available_moves()
-
-        if game.is_finished or depth == 0:
-            return self._evaluate_tictactoe(game, 'AI'), None
-
-        if player == 'AI':
-            max_score = float('-inf')
-            best_move = None
-            for move in available_moves:
-                test_game = game.clone()
-                test_game.make_move(player, move)
-                score, _ = self._minimax_tictactoe(test_game, game.get_opponent(player), depth - 1)
-                if score > max_score:
-                    max_score = score
-                    best_move = move
-            return max_score, best_move
+    def _minimax_tictactoe(self, game: TicTacToe, depth: int) -> Tuple[int, Optional[int]]:
+        """井字棋Minimax算法（位棋盘实现，AI为当前行棋方）"""
+        bb1, bb2 = game.x_bb, game.o_bb
+        if game.player1_id == 'AI':
+            ai_bb, opponent_bb = bb1, bb2
         else:
-            min_score = float('inf')
-            best_move = None
-            for move in available_moves:
-                test_game = game.clone()
-                test_game.make_move(player, move)
-                score, _ = self._minimax_tictactoe(test_game, game.get_opponent(player), depth - 1)
-                if score < min_score:
-                    min_score = score
-                    best_move = move
-            return min_score, best_move
-
-    def _evaluate_tictactoe(self, game: TicTacToe, ai_player: str) -> int:
-        """评估井字棋局面"""
-        if game.is_finished:
-            if game.winner == ai_player:
-                return 10
-            elif game.winner is None:
-                return 0
-            else:
-                return -10
-        return 0
+            ai_bb, opponent_bb = bb2, bb1
+
+        score, move = tictactoe_best_move(ai_bb, opponent_bb, depth)
+        return score, move or None
 
     def _get_strategic_gomoku_move(self, game: Gomoku, available_moves: List[Tuple[int, int]]) -> Optional[
         Tuple[int, int]]:
         """获取五子棋策略性移动"""
-        ai_player = 'AI'
-        opponent = game.get_opponent(ai_player)
-
-        # 检查是否能获胜
-        for row, col in available_moves:
-            test_game = game.clone()
-            test_game.board[row][col] = test_game.player_numbers[ai_player]
-            if test_game._check_winner(row, col):
-                return (row, col)
-
-        # 检查是否需要阻止对手获胜
-        for row, col in available_moves:
-            test_game = game.clone()
-            test_game.board[row][col] = test_game.player_numbers[opponent]
-            if test_game._check_winner(row, col):
-                return (row, col)
+        size = game.board_size
+
+        # 检查是否能获胜，其次检查是否需要阻止对手获胜
+        move = self._find_gomoku_winning_move(game)
+        if move:
+            return move
 
         # 如果是第一步，选择中心附近
         if game.moves_count == 0:
@@ -188,7 +151,7 @@ class AISystem:
                     if dr == 0 and dc == 0:
                         continue
                     new_row, new_col = last_row + dr, last_col + dc
-                    if (new_row, new_col) in available_moves:
+                    if 0 <= new_row < size and 0 <= new_col < size and game.board[new_row][new_col] == 0:
                         return (new_row, new_col)
 
         return None
@@ -196,10 +159,45 @@ class AISystem:
     def _get_advanced_gomoku_move(self, game: Gomoku, available_moves: List[Tuple[int, int]]) -> Optional[
         Tuple[int, int]]:
         """获取五子棋高级策略移动"""
-        # 这里可以实现更复杂的五子棋AI算法
-        # 目前使用基本策略
+        # 能直接获胜或必须防守时无需搜索
+        move = self._find_gomoku_winning_move(game)
+        if move:
+            return move
+
+        if game.moves_count == 0:
+            center = game.board_size // 2
+            return (center, center)
+
+        # Alpha-Beta搜索（仅考虑已有棋子附近的位置）
+        ai_bb, opponent_bb = self._get_gomoku_bitboards(game)
+        side = game.player_numbers['AI'] - 1
+        square = gomoku_best_move(ai_bb, opponent_bb, game.board_size, tt=self.transposition_table, side=side)
+        if square >= 0:
+            return divmod(square, game.board_size)
+
         return self._get_strategic_gomoku_move(game, available_moves)
 
+    def _get_gomoku_bitboards(self, game: Gomoku) -> Tuple[int, int]:
+        """获取五子棋(AI位棋盘, 对手位棋盘)"""
+        # 由游戏维护的行位棋盘拼接，无需逐格扫描棋盘
+        bb1, bb2 = game.get_bitboards()
+        if game.player_numbers['AI'] == 1:
+            return bb1, bb2
+        return bb2, bb1
+
+    def _find_gomoku_winning_move(self, game: Gomoku) -> Optional[Tuple[int, int]]:
+        """查找AI一步获胜的位置，其次查找需要阻止对手获胜的位置"""
+        size = game.board_size
+        masks_by_square = gomoku_masks_by_square(size)
+        ai_bb, opponent_bb = self._get_gomoku_bitboards(game)
+        empty = ((1 << (size * size)) - 1) & ~(ai_bb | opponent_bb)
+
+        for bb in (ai_bb, opponent_bb):
+            square = find_winning_square(bb, empty, masks_by_square)
+            if square >= 0:
+                return divmod(square, size)
+        return None
+
     def get_difficulty_description(self, difficulty: str) -> str:
         """获取难度描述"""
         descriptions = {
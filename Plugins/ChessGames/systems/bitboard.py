@@ -0,0 +1,152 @@
+"""
+位棋盘工具 - 用整数位表示棋子，供AI快速搜索使用
+"""
+
+from functools import lru_cache
+from typing import List, Tuple
+
+# 井字棋：9个格子，位i对应位置i+1
+TTT_FULL = (1 << 9) - 1
+TTT_WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # 行
+    0b001001001, 0b010010010, 0b100100100,  # 列
+    0b100010001, 0b001010100  # 对角线
+)
+# 经过每个格子的连线（落子后只需检查这些连线）
+TTT_MASKS_BY_SQUARE = tuple(tuple(mask for mask in TTT_WIN_MASKS if mask >> square & 1) for square in range(9))
+
+
+def board_to_bitboards(board: List[List[int]]) -> Tuple[int, int]:
+    """将二维棋盘转换为(玩家1位棋盘, 玩家2位棋盘)"""
+    bb1 = bb2 = 0
+    bit = 1
+    for row in board:
+        for cell in row:
+            if cell == 1:
+                bb1 |= bit
+            elif cell == 2:
+                bb2 |= bit
+            bit <<= 1
+    return bb1, bb2
+
+
+def has_line(bb: int, masks) -> bool:
+    """检查位棋盘是否包含任一连线"""
+    for mask in masks:
+        if bb & mask == mask:
+            return True
+    return False
+
+
+# 井字棋连线查表：下标为一方的位棋盘，共512项，代替逐条连线检查
+TTT_HAS_LINE = tuple(has_line(bb, TTT_WIN_MASKS) for bb in range(1 << 9))
+
+# 井字棋空位查表：下标为已占用格子的位棋盘，值为按升序排列的空位编号(1-9)
+TTT_EMPTY_SQUARES = tuple(tuple(square + 1 for square in range(9) if not occupied >> square & 1)
+                          for occupied in range(1 << 9))
+
+# 井字棋着法顺序：中心、角、边（好的着法排在前面以提高剪枝效率）
+TTT_MOVE_ORDER = tuple(1 << square for square in (4, 0, 2, 6, 8, 1, 3, 5, 7))
+
+# 井字棋胜负基础分（实际得分会加上剩余深度，越快获胜得分越高）
+TTT_WIN_SCORE = 10
+
+
+def tictactoe_minimax(me: int, opp: int, depth: int, alpha: int, beta: int, is_max: bool) -> int:
+    """井字棋Alpha-Beta搜索（me为AI棋子，opp为对手棋子）"""
+    if TTT_HAS_LINE[me]:
+        return TTT_WIN_SCORE + depth
+    if TTT_HAS_LINE[opp]:
+        return -TTT_WIN_SCORE - depth
+
+    occupied = me | opp
+    if occupied == TTT_FULL or depth == 0:
+        return 0
+
+    if is_max:
+        for bit in TTT_MOVE_ORDER:
+            if occupied & bit:
+                continue
+            score = tictactoe_minimax(me | bit, opp, depth - 1, alpha, beta, False)
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+    else:
+        for bit in TTT_MOVE_ORDER:
+            if occupied & bit:
+                continue
+            score = tictactoe_minimax(me, opp | bit, depth - 1, alpha, beta, True)
+            if score < beta:
+                beta = score
+                if alpha >= beta:
+                    break
+        return beta
+
+
+def tictactoe_best_move(me: int, opp: int, depth: int = 9) -> Tuple[int, int]:
+    """返回(最佳得分, 最佳位置1-9)，无可走位置时位置为0"""
+    occupied = me | opp
+    inf = TTT_WIN_SCORE + 10
+    best_score, best_move = -inf, 0
+    for bit in TTT_MOVE_ORDER:
+        if occupied & bit:
+            continue
+        score = tictactoe_minimax(me | bit, opp, depth - 1, best_score, inf, False)
+        if score > best_score:
+            best_score, best_move = score, bit.bit_length()
+    return best_score, best_move
+
+
+# 五子棋连线方向：横、竖、主对角线、副对角线
+GOMOKU_DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+@lru_cache(maxsize=None)
+def gomoku_win_masks(board_size: int, length: int = 5) -> Tuple[int, ...]:
+    """生成棋盘上所有五连掩码（15x15共572条）"""
+    masks = []
+    for row in range(board_size):
+        for col in range(board_size):
+            for dr, dc in GOMOKU_DIRECTIONS:
+                end_row, end_col = row + dr * (length - 1), col + dc * (length - 1)
+                if not (0 <= end_row < board_size and 0 <= end_col < board_size):
+                    continue
+                mask = 0
+                for k in range(length):
+                    mask |= 1 << ((row + dr * k) * board_size + (col + dc * k))
+                masks.append(mask)
+    return tuple(masks)
+
+
+@lru_cache(maxsize=None)
+def gomoku_masks_by_square(board_size: int, length: int = 5) -> Tuple[Tuple[int, ...], ...]:
+    """为每个格子生成经过该格子的所有五连掩码"""
+    masks_by_square = [[] for _ in range(board_size * board_size)]
+    for mask in gomoku_win_masks(board_size, length):
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            masks_by_square[bit.bit_length() - 1].append(mask)
+    return tuple(tuple(masks) for masks in masks_by_square)
+
+
+def find_winning_square(bb: int, empty: int, masks_by_square) -> int:
+    """查找落子即可连成五子的格子，返回格子索引，找不到返回-1"""
+    while empty:
+        bit = empty & -empty
+        empty ^= bit
+        square = bit.bit_length() - 1
+        placed = bb | bit
+        for mask in masks_by_square[square]:
+            if placed & mask == mask:
+                return square
+    return -1
+
+
+# 默认15x15棋盘的掩码在导入时生成，避免第一次AI落子时才计算
+GOMOKU_BOARD_SIZE = 15
+GOMOKU_WIN_MASKS = gomoku_win_masks(GOMOKU_BOARD_SIZE)
+GOMOKU_MASKS_BY_SQUARE = gomoku_masks_by_square(GOMOKU_BOARD_SIZE)
@@ -2,15 +2,31 @@
 渲染系统
 """
 
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 from Core.tools.browser import browser
 
+# 同时进行的渲染数上限
+MAX_RENDER_WORKERS = min(4, os.cpu_count() or 1)
+
 
 class RenderSystem:
     """渲染系统 - 简单封装"""
 
     def __init__(self):
         """初始化渲染系统"""
-        pass  # 不需要任何初始化
+        # 渲染线程池（延迟创建）
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """获取渲染线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_RENDER_WORKERS,
+                                                thread_name_prefix='ChessGamesRender')
+        return self._executor
 
     async def render_to_image(self, template_name: str, data: dict, width: int = None) -> str:
         """
@@ -27,5 +43,12 @@ class RenderSystem:
         # 构建模板路径：ChessGames/templates/xxx.html
         template_path = f'ChessGames/templates/{template_name}'
 
-        # 直接使用系统级浏览器管理器
-        return browser.render(template_path, data, width)
+        # 浏览器渲染是同步阻塞调用，放到线程池执行，避免阻塞事件循环上的其他命令
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), browser.render, template_path, data, width)
+
+    def shutdown(self):
+        """关闭渲染线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
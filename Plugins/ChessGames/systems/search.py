@@ -0,0 +1,234 @@
+"""
+五子棋搜索 - 基于位棋盘的Alpha-Beta搜索
+"""
+
+import random
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from .bitboard import gomoku_masks_by_square, gomoku_win_masks
+
+# 五连窗口内己方棋子数对应的分值（5个即获胜）
+WINDOW_SCORES = (0, 1, 10, 100, 1000)
+WIN_SCORE = 1000000
+
+# 每个节点最多展开的候选着法数
+MAX_CANDIDATES = 10
+
+# 置换表条目类型
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(board_size: int) -> Tuple[Tuple[int, int], ...]:
+    """每个格子两种棋子的Zobrist随机数（固定种子，保证进程内外一致）"""
+    rng = random.Random(board_size)
+    return tuple((rng.getrandbits(64), rng.getrandbits(64)) for _ in range(board_size * board_size))
+
+
+def zobrist_hash(bb1: int, bb2: int, board_size: int) -> int:
+    """计算局面的Zobrist哈希"""
+    table = zobrist_table(board_size)
+    value = 0
+    for side, bb in ((0, bb1), (1, bb2)):
+        while bb:
+            bit = bb & -bb
+            bb ^= bit
+            value ^= table[bit.bit_length() - 1][side]
+    return value
+
+
+class TranspositionTable:
+    """定长置换表：按哈希低位寻址，深度更深或条目过期时替换"""
+
+    def __init__(self, size_bits: int = 16):
+        self.size = 1 << size_bits
+        self.mask = self.size - 1
+        # 条目: (key, depth, flag, score, best_square, generation)
+        self.entries: List[Optional[tuple]] = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        """开始新的搜索（旧条目通过代数老化，不需要清零）"""
+        self.generation += 1
+
+    def probe(self, key: int) -> Optional[tuple]:
+        """查找条目"""
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: int, best_square: int):
+        """写入条目"""
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, flag, score, best_square, self.generation)
+
+
+@lru_cache(maxsize=None)
+def _board_masks(board_size: int) -> Tuple[int, int, int]:
+    """返回(全盘掩码, 去掉第一列的掩码, 去掉最后一列的掩码)"""
+    full = (1 << (board_size * board_size)) - 1
+    first_col = last_col = 0
+    for row in range(board_size):
+        first_col |= 1 << (row * board_size)
+        last_col |= 1 << (row * board_size + board_size - 1)
+    return full, full & ~first_col, full & ~last_col
+
+
+def neighborhood(occupied: int, board_size: int, radius: int = 2) -> int:
+    """返回距离已有棋子radius格以内（切比雪夫距离）的空位"""
+    full, not_first_col, not_last_col = _board_masks(board_size)
+    area = occupied
+    for _ in range(radius):
+        horizontal = area | ((area << 1) & not_first_col) | ((area >> 1) & not_last_col)
+        area = (horizontal | (horizontal << board_size) | (horizontal >> board_size)) & full
+    return area & ~occupied
+
+
+def _window_value(me: int, opp: int, mask: int) -> int:
+    """单个五连窗口对me的价值"""
+    mine = me & mask
+    theirs = opp & mask
+    if mine and theirs:
+        return 0
+    if mine:
+        return WINDOW_SCORES[mine.bit_count()]
+    if theirs:
+        return -WINDOW_SCORES[theirs.bit_count()]
+    return 0
+
+
+def evaluate(me: int, opp: int, board_size: int) -> int:
+    """局面对me的静态评估分"""
+    return sum(_window_value(me, opp, mask) for mask in gomoku_win_masks(board_size))
+
+
+def move_gain(me: int, opp: int, square: int, masks) -> int:
+    """me在square落子后局面分值的变化，落子成五时返回WIN_SCORE"""
+    bit = 1 << square
+    placed = me | bit
+    gain = 0
+    for mask in masks[square]:
+        if placed & mask == mask:
+            return WIN_SCORE
+        gain += _window_value(placed, opp, mask) - _window_value(me, opp, mask)
+    return gain
+
+
+def _ordered_candidates(me: int, opp: int, board_size: int, masks,
+                        first_square: int = -1) -> List[Tuple[int, int, int]]:
+    """生成候选着法并按进攻+防守价值排序，返回[(排序分, 格子, 己方增益)]
+
+    first_square为置换表记录的最佳着法，排在最前面
+    """
+    candidates = []
+    area = neighborhood(me | opp, board_size)
+    while area:
+        bit = area & -area
+        area ^= bit
+        square = bit.bit_length() - 1
+        gain = move_gain(me, opp, square, masks)
+        block = move_gain(opp, me, square, masks)
+        order = WIN_SCORE * 4 if square == first_square else gain + block
+        candidates.append((order, square, gain))
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    return candidates[:MAX_CANDIDATES]
+
+
+def _negamax(me: int, opp: int, score: int, depth: int, alpha: int, beta: int,
+             board_size: int, masks, key: int, side: int, tt: TranspositionTable) -> int:
+    """负极大值Alpha-Beta搜索
+
+    score为当前局面对me的评估分，key为局面Zobrist哈希，side为me的棋子编号(0/1)
+    """
+    if depth == 0:
+        return score
+
+    alpha_orig = alpha
+    first_square = -1
+    entry = tt.probe(key)
+    if entry is not None:
+        first_square = entry[4]
+        if entry[1] >= depth:
+            flag, cached = entry[2], entry[3]
+            if flag == TT_EXACT:
+                return cached
+            if flag == TT_LOWER and cached > alpha:
+                alpha = cached
+            elif flag == TT_UPPER and cached < beta:
+                beta = cached
+            if alpha >= beta:
+                return cached
+
+    candidates = _ordered_candidates(me, opp, board_size, masks, first_square)
+    if not candidates:
+        return 0
+
+    table = zobrist_table(board_size)
+    best = -WIN_SCORE * 2
+    best_square = -1
+    for _, square, gain in candidates:
+        if gain == WIN_SCORE:
+            # 越快获胜分数越高
+            return WIN_SCORE + depth
+        value = -_negamax(opp, me | (1 << square), -(score + gain), depth - 1, -beta, -alpha,
+                          board_size, masks, key ^ table[square][side], side ^ 1, tt)
+        if value > best:
+            best = value
+            best_square = square
+        if best > alpha:
+            alpha = best
+            if alpha >= beta:
+                break
+
+    if best <= alpha_orig:
+        flag = TT_UPPER
+    elif best >= beta:
+        flag = TT_LOWER
+    else:
+        flag = TT_EXACT
+    tt.store(key, depth, flag, best, best_square)
+    return best
+
+
+def gomoku_best_move(me: int, opp: int, board_size: int, max_depth: int = 3,
+                     tt: Optional[TranspositionTable] = None, side: int = 0) -> int:
+    """迭代加深搜索me的最佳落子，返回格子索引，无候选时返回-1
+
+    side为me的棋子编号(0=黑, 1=白)，用于Zobrist哈希
+    """
+    if tt is None:
+        tt = TranspositionTable()
+    tt.new_search()
+
+    masks = gomoku_masks_by_square(board_size)
+    table = zobrist_table(board_size)
+    key = zobrist_hash(opp, me, board_size) if side else zobrist_hash(me, opp, board_size)
+    score = evaluate(me, opp, board_size)
+    root_moves = _ordered_candidates(me, opp, board_size, masks)
+    if not root_moves:
+        return -1
+
+    best_square = root_moves[0][1]
+    for depth in range(1, max_depth + 1):
+        alpha, beta = -WIN_SCORE * 2, WIN_SCORE * 2
+        scored_moves = []
+        for _, square, gain in root_moves:
+            if gain == WIN_SCORE:
+                return square
+            value = -_negamax(opp, me | (1 << square), -(score + gain), depth - 1, -beta, -alpha, board_size, masks,
+                              key ^ table[square][side], side ^ 1, tt)
+            scored_moves.append((value, square, gain))
+            if value > alpha:
+                alpha = value
+                best_square = square
+
+        # 上一层的结果用于下一层的根节点排序
+        scored_moves.sort(key=lambda item: item[0], reverse=True)
+        root_moves = scored_moves
+    return best_square